@@ -12,18 +12,43 @@ Author: Brayden Joyce
 Company: Doosan/Bobcat Company
 """
 
+import os
 import re
+import sys
+import gzip
+import hashlib
 import time
 import json
+import pickle
 import logging
+import threading
+import importlib.util
+from io import BytesIO
+from array import array
 from datetime import datetime
+from itertools import chain
 from collections import OrderedDict
+from functools import lru_cache, cached_property
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
-import xml.etree.ElementTree as ET
-from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils import get_column_letter
+
+# lxml (libxml2) is much faster than the stdlib parser; ElementTree is kept as
+# a fallback so the extractor still runs where lxml is not installed
+try:
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAS_LXML = False
+
+# Parquet output for the raw facts needs one of pandas' parquet engines; only
+# checked for here (not imported) so startup does not pay for pyarrow
+HAS_PARQUET = any(importlib.util.find_spec(engine) is not None for engine in ('pyarrow', 'fastparquet'))
 
 # -----------------------------------------------------------------------------
 # Logging Configuration
@@ -35,10 +60,317 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# -----------------------------------------------------------------------------
+# Streaming Downloads
+# -----------------------------------------------------------------------------
+class _CacheTee:
+    """
+    Read-through wrapper around a streamed response body that copies every
+    chunk into a gzip cache file. The entry is committed only once the body
+    has been read to EOF, so an aborted parse never leaves a partial file.
+    """
+
+    def __init__(self, raw, path):
+        self.raw = raw
+        self.path = path
+        self.tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.out = gzip.open(self.tmp_path, 'wb', compresslevel=1)
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        if self.out is not None:
+            if data:
+                self.out.write(data)
+            else:
+                self.out.close()
+                os.replace(self.tmp_path, self.path)
+                self.out = None
+        return data
+
+    def close(self):
+        """Release the response; discard the temp file if the body was not fully read"""
+        self.raw.close()
+        if self.out is not None:
+            self.out.close()
+            os.remove(self.tmp_path)
+            self.out = None
+
+
+# -----------------------------------------------------------------------------
+# XBRL Namespaces (Clark notation, resolved once)
+# -----------------------------------------------------------------------------
+NS_XBRLI = 'http://www.xbrl.org/2003/instance'
+NS_XBRLDI = 'http://xbrl.org/2006/xbrldi'
+
+TAG_CONTEXT = f'{{{NS_XBRLI}}}context'
+TAG_SEGMENT = f'{{{NS_XBRLI}}}segment'
+TAG_INSTANT = f'{{{NS_XBRLI}}}instant'
+TAG_START_DATE = f'{{{NS_XBRLI}}}startDate'
+TAG_END_DATE = f'{{{NS_XBRLI}}}endDate'
+TAG_EXPLICIT_MEMBER = f'{{{NS_XBRLDI}}}explicitMember'
+
+# Bytes handed to the XML parser per feed() call when streaming an instance
+XML_CHUNK_SIZE = 64 * 1024
+
+
+# -----------------------------------------------------------------------------
+# SEC Request Throttling
+# -----------------------------------------------------------------------------
+# SEC fair access: 10 requests/second max, shared by all download threads
+SEC_MAX_REQUESTS_PER_SECOND = 10
+
+# Throttling (429) and transient server errors are retried with exponential
+# backoff, honouring Retry-After. The last response is returned rather than
+# raised, so callers still see a failure through raise_for_status()
+SEC_RETRY = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=('GET',), raise_on_status=False)
+
+
+class _RateLimiter:
+    """Thread-safe limiter that spaces calls to at most `rate` per second"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        """Block until the caller's request slot is reached"""
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+# -----------------------------------------------------------------------------
+# EDGAR Instance Discovery Patterns
+# -----------------------------------------------------------------------------
+_HREF_ALL_RE = re.compile(r'href="([^"]+)"', re.IGNORECASE)
+_HREF_XML_RE = re.compile(r'href="([^"]+\.xml)"', re.IGNORECASE)
+
+# Known non-instance files (matched against lowercased names), compiled into
+# one alternation so each name is scanned once instead of once per substring
+_EXCLUDE_SUBSTR = ('_cal.xml', '_def.xml', '_lab.xml', '_pre.xml',
+                   '.xsd', 'filingsummary', 'metalink', 'schema')
+_EXCLUDE_RE = re.compile('|'.join(re.escape(ex) for ex in _EXCLUDE_SUBSTR))
+
+
+# -----------------------------------------------------------------------------
+# Context Resolution
+# -----------------------------------------------------------------------------
+@lru_cache(maxsize=4096)
+def _resolve_segment(members):
+    """
+    Resolve a context's explicit members to (segment, dimension, business_segment).
+    
+    Args:
+        members: Tuple of (dimension, member) pairs in document order
+    
+    The same dimension/member combinations repeat across contexts and filings,
+    so results are cached and shared.
+    """
+    # Default to consolidated unless a segment is present
+    segment_name = "Consolidated"
+    segment_dimension = None
+    business_segment = None
+    for dim, member in members:
+        # Capture business segment axis separately
+        if 'StatementBusinessSegmentsAxis' in dim:
+            business_segment = member
+        # First dimension stays the primary segment for multi-dimensional
+        # contexts (e.g. segment + consolidation axis) for backward compat
+        if segment_name == "Consolidated":
+            segment_name = member
+            segment_dimension = dim
+    return segment_name, segment_dimension, business_segment
+
+
+@lru_cache(maxsize=8192)
+def _localname(clark_tag):
+    """Interned local name of a Clark-notation tag ('{uri}Name' -> 'Name'), cached per tag"""
+    return sys.intern(clark_tag.rpartition('}')[2])
+
+
+# -----------------------------------------------------------------------------
+# XBRL Parser Target
+# -----------------------------------------------------------------------------
+class _XBRLTarget:
+    """
+    Parser target that turns an XBRL instance into context and fact callbacks.
+    
+    The parser calls start/data/end directly, so no element tree is built and
+    nothing has to be cleared behind it. Only contexts (period dates and the
+    explicit members of their entity segment) and elements carrying a
+    contextRef are tracked; like ``elem.text``, a fact's text stops at its
+    first child element.
+    
+    Args:
+        on_context: Called with the context id, its (dimension, member) pairs
+            in document order, and its start, end and instant dates
+        on_fact: Called with (tag, text, context_ref, unit_ref, decimals) for
+            every fact with non-empty text
+    """
+    
+    def __init__(self, on_context, on_fact):
+        self.on_context = on_context
+        self.on_fact = on_fact
+        self.namespaces = {}
+        self._context = None
+        self._in_segment = False
+        self._member_dimension = None
+        self._fact = None
+        self._fact_depth = 0
+        self._fact_has_child = False
+        self._text = None
+    
+    def start_ns(self, prefix, uri):
+        # First declaration wins, so root-level prefixes are not overridden
+        if prefix and prefix not in self.namespaces:
+            self.namespaces[prefix] = uri
+    
+    def start(self, tag, attrib):
+        if self._fact is not None:
+            self._fact_depth += 1
+            self._fact_has_child = True
+            return
+        
+        context = self._context
+        if context is not None:
+            if tag == TAG_SEGMENT:
+                self._in_segment = True
+            elif tag == TAG_EXPLICIT_MEMBER:
+                if self._in_segment:
+                    self._member_dimension = attrib.get('dimension')
+                    self._text = []
+            elif tag == TAG_START_DATE or tag == TAG_END_DATE or tag == TAG_INSTANT:
+                self._text = []
+            return
+        
+        if tag == TAG_CONTEXT:
+            self._context = {'id': attrib.get('id'), 'segments': {},
+                             'start': None, 'end': None, 'instant': None}
+            return
+        
+        context_ref = attrib.get('contextRef')
+        if context_ref is not None:
+            self._fact = (tag, context_ref, attrib.get('unitRef'), attrib.get('decimals'))
+            self._fact_has_child = False
+            self._text = []
+    
+    def data(self, text):
+        if self._text is not None and not self._fact_has_child:
+            self._text.append(text)
+    
+    def end(self, tag):
+        fact = self._fact
+        if fact is not None:
+            if self._fact_depth:
+                self._fact_depth -= 1
+                return
+            text = ''.join(self._text)
+            self._fact = None
+            self._text = None
+            if text:
+                self.on_fact(fact[0], text, fact[1], fact[2], fact[3])
+            return
+        
+        context = self._context
+        if context is None:
+            return
+        if tag == TAG_EXPLICIT_MEMBER:
+            if self._member_dimension is not None:
+                member_value = ''.join(self._text)
+                # Strip namespace prefix if present
+                if ':' in member_value:
+                    member_value = member_value.split(':')[1]
+                context['segments'][self._member_dimension] = member_value
+                self._member_dimension = None
+                self._text = None
+        elif tag == TAG_START_DATE:
+            context['start'] = ''.join(self._text)
+            self._text = None
+        elif tag == TAG_END_DATE:
+            context['end'] = ''.join(self._text)
+            self._text = None
+        elif tag == TAG_INSTANT:
+            context['instant'] = ''.join(self._text)
+            self._text = None
+        elif tag == TAG_SEGMENT:
+            self._in_segment = False
+        elif tag == TAG_CONTEXT:
+            self._context = None
+            self.on_context(context['id'], tuple(context['segments'].items()),
+                            context['start'], context['end'], context['instant'])
+    
+    def close(self):
+        return None
+
+
+# -----------------------------------------------------------------------------
+# Categorical Columns
+# -----------------------------------------------------------------------------
+# Low-cardinality string columns stored as pandas categoricals (int codes plus
+# a small table of unique values) instead of one Python str per row
+CATEGORICAL_COLUMNS = ('tag', 'segment', 'form', 'business_segment', 'dimension', 'unit')
+
+# Columns the statement and segment pivots read; the sheet builders get this
+# narrower frame so their slices, hashes and dedups touch fewer blocks
+PIVOT_COLUMNS = ('tag', 'value', 'segment', 'business_segment', 'form', 'start_date', 'end_date', 'instant_date')
+
+# Where export_to_excel can put the raw facts: a gzip CSV or Parquet file next to
+# the workbook, or the 'All Data - Raw' sheet inside it
+RAW_FORMATS = ('csv', 'parquet', 'xlsx')
+
+# Bump when the parsed fact frame changes shape so frames cached by an older
+# version are not reused
+FRAME_CACHE_VERSION = 1
+
+# Date cells are written as Excel serial day numbers (days since EXCEL_EPOCH,
+# valid for dates after 1900-02-28) and displayed with EXCEL_DATE_FORMAT
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+EXCEL_DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# Rows converted to Python objects at a time when writing a sheet
+WRITE_CHUNK_ROWS = 8192
+
+
+def _fillna_category(series, value):
+    """fillna that also works on categorical columns (adds the fill value as a category)"""
+    if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+        series = series.cat.add_categories([value])
+    return series.fillna(value)
+
+
+def _contains_mask(series, substring):
+    """
+    Boolean array of rows whose value contains ``substring`` (missing -> False).
+    
+    On categoricals the substring test runs once per category and is mapped
+    through the integer codes instead of scanning every row's string.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        hits = np.fromiter((substring in category for category in categories), dtype=bool, count=len(categories))
+        # Code -1 (missing) indexes the trailing False
+        return np.append(hits, False)[series.cat.codes.to_numpy()]
+    return series.str.contains(substring, regex=False, na=False).to_numpy(dtype=bool)
+
+
 class ComprehensiveXBRLExtractor:
     """Extract complete financial statements with segment breakdowns"""
 
-    def __init__(self, email, cik, company_name, ticker):
+    # Statement item suffix ('<Tag>_<suffix>') -> segment member it reads
+    STATEMENT_SEGMENT_MAP = {
+        'FinancialProducts': 'FinancialProductsMember',
+        'MET': 'MachineryEnergyTransportationMember',
+        'EXFP': 'AllOtherExcludingFinancialProductsMember',
+        'Total': 'Consolidated',
+    }
+
+    def __init__(self, email, cik, company_name, ticker, max_workers=8, cache=True, cache_dir=None):
         """
         Initialize the extractor
         
@@ -47,6 +379,9 @@ class ComprehensiveXBRLExtractor:
             cik: Company CIK number (with leading zeros, e.g., "0000018230")
             company_name: Company name for logging
             ticker: Company ticker symbol (lowercase, for file identification)
+            max_workers: Number of filings downloaded/parsed concurrently
+            cache: Keep filing listings, downloaded files and parsed facts on disk (filings are immutable)
+            cache_dir: Cache location (default: ~/.cache/sec-edgar/<cik>)
         """
         self.base_url = "https://data.sec.gov"
         self.sec_archives = "https://www.sec.gov/Archives/edgar/data"
@@ -60,11 +395,31 @@ class ComprehensiveXBRLExtractor:
         self.cik_int = str(int(cik))  # "18230"
         self.company_name = company_name
         self.ticker = ticker.lower()
+        self.max_workers = max_workers
+        self.cache = cache
+        self.cache_dir = cache_dir or os.path.join(
+            os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'sec-edgar', self.cik_int
+        )
+
+        # One pooled session for all SEC requests (keep-alive across files),
+        # throttled globally instead of sleeping after every request. Each
+        # worker thread keeps its own connection per host, so the pool is
+        # sized to the worker count rather than discarding connections.
+        # Transient failures are retried at the adapter (see SEC_RETRY)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=max(16, max_workers),
+                                                   max_retries=SEC_RETRY))
+        self.rate_limiter = _RateLimiter(SEC_MAX_REQUESTS_PER_SECOND)
+
+        # Raw facts file written by the last export_to_excel (None when the raw
+        # facts went into the workbook or were skipped)
+        self.raw_data_file = None
 
         # XBRL namespaces (updated from document during parsing)
         self.namespaces = {
-            'xbrli': 'http://www.xbrl.org/2003/instance',
-            'xbrldi': 'http://xbrl.org/2006/xbrldi',
+            'xbrli': NS_XBRLI,
+            'xbrldi': NS_XBRLDI,
         }
 
     # -------------------------------------------------------------------------
@@ -443,23 +798,87 @@ class ComprehensiveXBRLExtractor:
     # -------------------------------------------------------------------------
     # EDGAR Filing Retrieval (Robust Instance Discovery)
     # -------------------------------------------------------------------------
+    def _get(self, url: str, stream: bool = False, headers=None):
+        """GET through the shared session, respecting the SEC rate limit"""
+        self.rate_limiter.wait()
+        return self.session.get(url, stream=stream, headers=headers)
+
+    def _cache_read(self, kind: str, key: str):
+        """Return cached bytes for (kind, key), or None on a miss"""
+        try:
+            with gzip.open(os.path.join(self.cache_dir, kind, key), 'rb') as f:
+                return f.read()
+        except (OSError, EOFError):
+            return None
+
+    def _cache_write(self, kind: str, key: str, data: bytes):
+        """Store bytes under (kind, key); written to a temp file then renamed"""
+        folder = os.path.join(self.cache_dir, kind)
+        path = os.path.join(folder, key)
+        try:
+            os.makedirs(folder, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, 'wb', compresslevel=1) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache file {path}: {e}")
+
+    def _frame_cache_key(self, filings, wanted_tags) -> str:
+        """Cache key for the fact frame parsed from a set of filings under a tag whitelist"""
+        # The pandas version is part of the key so an upgrade re-parses instead of
+        # unpickling a frame written by another version
+        parts = [FRAME_CACHE_VERSION, pd.__version__, [filing['accession'] for filing in filings],
+                 sorted(wanted_tags) if wanted_tags is not None else None]
+        return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest() + '.pkl.gz'
+
+    def _fetch_submissions(self, url: str):
+        """
+        Fetch the submissions JSON, revalidating a cached copy when caching is enabled.
+        
+        The listing changes whenever the company files, so unlike filings it is not
+        reused blindly: the stored ETag/Last-Modified are sent back and the cached
+        body is only used on a 304 Not Modified.
+        """
+        cache_key = 'submissions.json.gz'
+        cached_entry = None
+        headers = {}
+        if self.cache:
+            cached = self._cache_read('submissions', cache_key)
+            if cached is not None:
+                cached_entry = json.loads(cached)
+                if cached_entry.get('etag'):
+                    headers['If-None-Match'] = cached_entry['etag']
+                if cached_entry.get('last_modified'):
+                    headers['If-Modified-Since'] = cached_entry['last_modified']
+        
+        response = self._get(url, headers=headers or None)
+        if response.status_code == 304 and cached_entry is not None:
+            logger.info("Submissions listing not modified, using cached copy")
+            return cached_entry['data']
+        response.raise_for_status()
+        
+        data = response.json()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if self.cache and (etag or last_modified):
+            entry = {'etag': etag, 'last_modified': last_modified, 'data': data}
+            self._cache_write('submissions', cache_key, json.dumps(entry).encode('utf-8'))
+        return data
+
     def get_all_filings(self, start_year=2020):
         """Get all 10-Q and 10-K filings from start_year to present"""
         url = f"{self.base_url}/submissions/CIK{self.cik}.json"
         logger.info(f"Fetching all filings since {start_year} for {self.company_name}")
         
         try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            time.sleep(0.2)  # SEC rate limiting
-            
-            data = response.json()
+            data = self._fetch_submissions(url)
             recent = data['filings']['recent']
             
             filings = []
             for i in range(len(recent['form'])):
                 filing_date = recent['filingDate'][i]
-                filing_year = int(filing_date.split('-')[0])
+                filing_year = int(filing_date[:4])  # SEC dates are ISO YYYY-MM-DD
                 
                 if filing_year >= start_year:
                     form = recent['form'][i]
@@ -489,15 +908,28 @@ class ComprehensiveXBRLExtractor:
         """
         Return directory items using index.json or HTML directory fallback.
         This prevents 404 errors from hardcoded filename assumptions.
+        Listings are cached on disk per accession when caching is enabled.
         """
+        cache_key = f"{accession}.json.gz"
+        if self.cache:
+            cached = self._cache_read('index', cache_key)
+            if cached is not None:
+                return json.loads(cached)
+        
+        items = self._fetch_filing_items(accession)
+        if self.cache and items:
+            self._cache_write('index', cache_key, json.dumps(items).encode('utf-8'))
+        return items
+
+    def _fetch_filing_items(self, accession: str):
+        """Fetch directory items from EDGAR (index.json, then HTML listing)"""
         base_dir = self._filing_base_dir(accession)
         
         # Try index.json first (preferred method)
         idx_url = f"{base_dir}/index.json"
         try:
-            r = requests.get(idx_url, headers=self.headers)
+            r = self._get(idx_url)
             if r.status_code == 200:
-                time.sleep(0.2)
                 j = r.json()
                 items = j.get('directory', {}).get('item', [])
                 # Normalize to list of dicts with at least "name"
@@ -507,13 +939,12 @@ class ComprehensiveXBRLExtractor:
         
         # Fallback: parse HTML directory listing
         try:
-            r = requests.get(base_dir, headers=self.headers)
+            r = self._get(base_dir)
             r.raise_for_status()
-            time.sleep(0.2)
             html = r.text
             
             # Extract hrefs from HTML
-            hrefs = re.findall(r'href="([^"]+)"', html, flags=re.IGNORECASE)
+            hrefs = _HREF_ALL_RE.findall(html)
             # Keep only same-folder filenames (no parent links or external URLs)
             names = [h for h in hrefs 
                     if not h.startswith('http') 
@@ -536,13 +967,13 @@ class ComprehensiveXBRLExtractor:
         if not names:
             return None
         
-        # Get all XML files
-        xmls = [n for n in names if n.lower().endswith('.xml')]
-        
-        # Exclude known non-instance files
-        EXCLUDE_SUBSTR = ['_cal.xml', '_def.xml', '_lab.xml', '_pre.xml',
-                         '.xsd', 'filingsummary', 'metalink', 'schema']
-        xmls = [n for n in xmls if all(ex not in n.lower() for ex in EXCLUDE_SUBSTR)]
+        # Get all XML files, excluding known non-instance files
+        # (each name is lowercased once and reused for every check)
+        xmls = []
+        for name in names:
+            low = name.lower()
+            if low.endswith('.xml') and not _EXCLUDE_RE.search(low):
+                xmls.append((name, low))
         
         # Prefer files matching common instance patterns
         preferences = [
@@ -551,131 +982,160 @@ class ComprehensiveXBRLExtractor:
         ]
         
         for pref in preferences:
-            filtered = [n for n in xmls if pref in n.lower()]
+            filtered = [name for name, low in xmls if pref in low]
             if filtered:
                 # If multiple matches, pick shortest name (usually the main instance)
-                return sorted(filtered, key=len)[0]
+                return min(filtered, key=len)
         
         # Otherwise, pick first remaining XML (stable order from index)
         if xmls:
-            return sorted(xmls, key=len)[0]
+            return min((name for name, _ in xmls), key=len)
         
         return None
 
-    def download_file(self, url: str) -> bytes:
-        """Download a file from SEC EDGAR with error handling"""
-        r = requests.get(url, headers=self.headers)
-        r.raise_for_status()
-        time.sleep(0.2)  # SEC rate limiting
-        return r.content
+    def download_file(self, url: str, stream: bool = False):
+        """
+        Download a file from SEC EDGAR with error handling (disk-cached by URL)
+        
+        Args:
+            url: File URL
+            stream: Return a readable file object over the response body
+                (copied into the cache as it is read) instead of bytes;
+                the caller must close() it
+        """
+        cache_key = hashlib.sha1(url.encode('utf-8')).hexdigest() + '.gz'
+        if self.cache:
+            cached = self._cache_read('files', cache_key)
+            if cached is not None:
+                return BytesIO(cached) if stream else cached
+        
+        if not stream:
+            r = self._get(url)
+            r.raise_for_status()
+            if self.cache:
+                self._cache_write('files', cache_key, r.content)
+            return r.content
+        
+        r = self._get(url, stream=True)
+        if not r.ok:
+            r.close()
+            r.raise_for_status()
+        # Let urllib3 undo any gzip/deflate transfer encoding while reading
+        r.raw.decode_content = True
+        if not self.cache:
+            return r.raw
+        try:
+            return _CacheTee(r.raw, os.path.join(self.cache_dir, 'files', cache_key))
+        except OSError as e:
+            logger.warning(f"Could not write cache file for {url}: {e}")
+            return r.raw
 
     # -------------------------------------------------------------------------
     # XBRL Parsing
     # -------------------------------------------------------------------------
-    def parse_context_elements(self, root):
-        """Parse XBRL context elements to understand segments and time periods"""
-        contexts = {}
+    def extract_facts_from_xbrl(self, xml_content, wanted_tags=None):
+        """
+        Extract all facts from XBRL instance document as a dict of columns.
         
-        for context in root.findall('.//xbrli:context', self.namespaces):
-            context_id = context.get('id')
-            period = context.find('xbrli:period', self.namespaces)
-            
-            instant = period.find('xbrli:instant', self.namespaces)
-            start = period.find('xbrli:startDate', self.namespaces)
-            end = period.find('xbrli:endDate', self.namespaces)
+        Streams the document through a parser target (_XBRLTarget) in fixed-size
+        chunks: contexts are resolved as they close and facts are handed over
+        one by one, without building an element tree. Facts that reference a
+        context defined later in the file are buffered and resolved at the end.
+        
+        Args:
+            xml_content: Instance document as bytes or a binary file object
+            wanted_tags: Optional set of tag local names to keep; other facts
+                are skipped before their value is parsed
+        """
+        # Facts are accumulated column-wise; values go into a packed float64
+        # buffer instead of one boxed float per fact dict
+        tags, values, context_ids, units, decimals_col = [], array('d'), [], [], []
+        segments, dimensions, business_segments = [], [], []
+        starts, ends, instants = [], [], []
+        
+        # Each context's segment fields are resolved once; facts sharing a
+        # context then only need a single dict lookup
+        resolved = {}
+        pending = []
+        
+        def add_fact(elem_tag, text, context_ref, unit_ref, decimals):
+            tag_name = _localname(elem_tag)
+            if wanted_tags is not None and tag_name not in wanted_tags:
+                return
             
-            context_info = {
-                'id': context_id,
-                'segments': {},
-                'instant': instant.text if instant is not None else None,
-                'start': start.text if start is not None else None,
-                'end': end.text if end is not None else None,
-            }
+            # Try to convert to numeric value
+            try:
+                value = float(text)
+            except (ValueError, TypeError):
+                return
             
-            # Extract segment/dimension information
-            entity = context.find('xbrli:entity', self.namespaces)
-            if entity is not None:
-                segment = entity.find('xbrli:segment', self.namespaces)
-                if segment is not None:
-                    for member in segment.findall('.//xbrldi:explicitMember', self.namespaces):
-                        dimension = member.get('dimension')
-                        member_value = member.text
-                        # Strip namespace prefix if present
-                        if ':' in member_value:
-                            member_value = member_value.split(':')[1]
-                        context_info['segments'][dimension] = member_value
+            # Tags, context and unit refs repeat across facts and filings;
+            # intern them so every fact shares one string object
+            context_ref = sys.intern(context_ref)
+            if unit_ref is not None:
+                unit_ref = sys.intern(unit_ref)
+            segment_name, segment_dimension, business_segment, start, end, instant = resolved[context_ref]
             
-            contexts[context_id] = context_info
+            tags.append(tag_name)
+            values.append(value)
+            context_ids.append(context_ref)
+            segments.append(segment_name)
+            dimensions.append(segment_dimension)
+            business_segments.append(business_segment)
+            starts.append(start)
+            ends.append(end)
+            instants.append(instant)
+            decimals_col.append(decimals)
+            units.append(unit_ref)
+        
+        def on_context(context_id, members, start, end, instant):
+            resolved[context_id] = _resolve_segment(members) + (start, end, instant)
+        
+        def on_fact(elem_tag, text, context_ref, unit_ref, decimals):
+            if context_ref in resolved:
+                add_fact(elem_tag, text, context_ref, unit_ref, decimals)
+            else:
+                # Forward reference: resolved once all contexts have been seen
+                pending.append((elem_tag, text, context_ref, unit_ref, decimals))
         
-        return contexts
-
-    def extract_facts_from_xbrl(self, xml_content: bytes):
-        """Extract all facts from XBRL instance document"""
-        root = ET.fromstring(xml_content)
+        target = _XBRLTarget(on_context, on_fact)
+        parser = ET.XMLParser(target=target, **({'huge_tree': True} if HAS_LXML else {}))
+        if isinstance(xml_content, (bytes, bytearray)):
+            parser.feed(xml_content)
+        else:
+            for chunk in iter(lambda: xml_content.read(XML_CHUNK_SIZE), b''):
+                parser.feed(chunk)
+        parser.close()
         
-        # Update namespaces from document
-        for prefix, uri in root.attrib.items():
-            if prefix.startswith('{http://www.w3.org/2000/xmlns/}'):
-                ns_prefix = prefix.split('}')[1]
-                self.namespaces[ns_prefix] = uri
+        for fact in pending:
+            if fact[2] in resolved:
+                add_fact(*fact)
         
-        contexts = self.parse_context_elements(root)
-        facts = []
+        # Update namespaces from the declarations seen while parsing
+        self.namespaces.update(target.namespaces)
         
-        # Iterate through all elements looking for facts
-        for elem in root.iter():
-            tag_name = elem.tag.split('}')[-1] if '}' in elem.tag else elem.tag
-            context_ref = elem.get('contextRef')
-            unit_ref = elem.get('unitRef')
-            decimals = elem.get('decimals')
-            
-            if context_ref in contexts and elem.text:
-                context = contexts[context_ref]
-                
-                # Default to consolidated unless a segment is present
-                segment_name = "Consolidated"
-                segment_dimension = None
-                business_segment = None
-                if context['segments']:
-                    for dim, member in context['segments'].items():
-                        # Capture business segment axis separately
-                        if 'StatementBusinessSegmentsAxis' in dim:
-                            business_segment = member
-                        if segment_name == "Consolidated":
-                            segment_name = member
-                            segment_dimension = dim
-                    # If we found a business segment, prefer it as the primary segment
-                    # for multi-dimensional contexts (e.g. segment + consolidation axis)
-                    if business_segment and segment_name != business_segment:
-                        # Keep business_segment separate; segment stays as-is for backward compat
-                        pass
-                
-                # Try to convert to numeric value
-                try:
-                    value = float(elem.text)
-                except (ValueError, TypeError):
-                    continue
-                
-                facts.append({
-                    'tag': tag_name,
-                    'value': value,
-                    'context_id': context_ref,
-                    'segment': segment_name,
-                    'dimension': segment_dimension,
-                    'business_segment': business_segment,
-                    'start_date': context['start'],
-                    'end_date': context['end'],
-                    'instant_date': context['instant'],
-                    'decimals': decimals,
-                    'unit': unit_ref
-                })
-        
-        return facts
-
-    def process_filing(self, filing: dict):
+        return {
+            'tag': tags,
+            'value': values,
+            'context_id': context_ids,
+            'segment': segments,
+            'dimension': dimensions,
+            'business_segment': business_segments,
+            'start_date': starts,
+            'end_date': ends,
+            'instant_date': instants,
+            'decimals': decimals_col,
+            'unit': units,
+        }
+
+    def process_filing(self, filing: dict, wanted_tags=None):
         """
         Process a single filing - discovers and downloads the XBRL instance.
         Uses robust discovery to avoid 404 errors from filename assumptions.
+        
+        Args:
+            filing: Filing metadata from get_all_filings
+            wanted_tags: Optional set of tag local names to keep (see extract_facts_from_xbrl)
         """
         try:
             base_dir = self._filing_base_dir(filing['accession'])
@@ -691,10 +1151,8 @@ class ComprehensiveXBRLExtractor:
                 try:
                     html = self.download_file(primary_url).decode('utf-8', errors='ignore')
                     # Look for .xml links, exclude non-instance patterns
-                    links = re.findall(r'href="([^"]+\.xml)"', html, flags=re.IGNORECASE)
-                    links = [l for l in links if not any(s in l.lower() for s in
-                                                         ['_cal.xml', '_def.xml', '_lab.xml', '_pre.xml',
-                                                          '.xsd', 'filingsummary', 'metalink', 'schema'])]
+                    links = _HREF_XML_RE.findall(html)
+                    links = [l for l in links if not _EXCLUDE_RE.search(l.lower())]
                     if links:
                         # Normalize to filename only
                         instance_name = links[0].split('/')[-1]
@@ -703,46 +1161,93 @@ class ComprehensiveXBRLExtractor:
             
             if not instance_name:
                 logger.warning(f"Could not locate XBRL instance for accession {filing['accession']} - skipping")
-                return []
+                return {}
             
             # Download and parse the instance
             instance_url = f"{base_dir}/{instance_name}"
-            xml_content = self.download_file(instance_url)
-            facts = self.extract_facts_from_xbrl(xml_content)
+            xml_stream = self.download_file(instance_url, stream=True)
+            try:
+                facts = self.extract_facts_from_xbrl(xml_stream, wanted_tags)
+            finally:
+                xml_stream.close()
             
             # Annotate facts with filing metadata
-            for fact in facts:
-                fact['accession'] = filing['accession']
-                fact['filing_date'] = filing['filing_date']
-                fact['report_date'] = filing['report_date']
-                fact['form'] = filing['form']
+            n_facts = len(facts['tag'])
+            for key in ('accession', 'filing_date', 'report_date', 'form'):
+                facts[key] = [filing[key]] * n_facts
             
-            logger.info(f"  Extracted {len(facts)} facts from {instance_name}")
+            logger.info(f"  Extracted {n_facts} facts from {instance_name}")
             return facts
             
         except requests.HTTPError as e:
             logger.error(f"HTTP error for filing {filing.get('accession')}: {e}")
-            return []
+            return {}
         except Exception as e:
             logger.error(f"Error processing filing: {e}")
-            return []
+            return {}
 
-    def extract_all_data(self, start_year=2020):
-        """Extract all financial data from filings"""
-        filings = self.get_all_filings(start_year=start_year)
-        all_facts = []
+    def extract_all_data(self, start_year=2020, keep_all_facts=False):
+        """
+        Extract all financial data from filings
         
-        for i, filing in enumerate(filings, 1):
-            logger.info(f"\n[{i}/{len(filings)}] " + "=" * 50)
-            facts = self.process_filing(filing)
-            all_facts.extend(facts)
+        Args:
+            start_year: First filing year to include
+            keep_all_facts: Keep every numeric fact instead of only the tags the
+                statement and segment sheets read (affects the raw data sheet)
+        """
+        filings = self.get_all_filings(start_year=start_year)
+        wanted_tags = None if keep_all_facts else self._wanted_tags
+        
+        # Filings are immutable, so the parsed frame only changes when a new filing
+        # appears or the tag whitelist changes; reuse it otherwise
+        frame_key = self._frame_cache_key(filings, wanted_tags)
+        if self.cache:
+            cached = self._cache_read('frames', frame_key)
+            if cached is not None:
+                try:
+                    df = pd.read_pickle(BytesIO(cached))
+                except Exception as e:
+                    # Treat an unreadable frame as a miss; the re-parsed frame below
+                    # replaces it
+                    logger.warning(f"Could not load cached facts {frame_key}, re-parsing: {e}")
+                else:
+                    logger.info(f"Reusing {len(df)} parsed facts from {len(filings)} unchanged filings")
+                    return df
+        
+        # Download and parse filings concurrently; results come back in filing order
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(lambda filing: self.process_filing(filing, wanted_tags), filings))
+        
+        for i, facts in enumerate(results, 1):
+            logger.info(f"[{i}/{len(filings)}] {filings[i - 1]['form']} {filings[i - 1]['report_date']}: "
+                        f"{len(facts.get('tag', []))} facts")
+        results = [facts for facts in results if facts]
+        # A filing that failed (or had no instance) is retried on the next run
+        # rather than baked into the cached frame
+        complete = len(results) == len(filings)
+        
+        # Build each column once across all filings, then the DataFrame in one step
+        all_facts = {}
+        if results:
+            for col in results[0]:
+                if col == 'value':
+                    all_facts[col] = np.concatenate(
+                        [np.frombuffer(facts[col], dtype=np.float64) for facts in results]
+                    )
+                else:
+                    all_facts[col] = list(chain.from_iterable(facts[col] for facts in results))
         
         # Convert to DataFrame and process dates
         df = pd.DataFrame(all_facts)
         if not df.empty:
             for date_col in ['start_date', 'end_date', 'instant_date', 'filing_date', 'report_date']:
                 if date_col in df.columns:
-                    df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
+                    # SEC/XBRL dates are ISO-8601; an explicit format keeps pandas on its C parser
+                    df[date_col] = pd.to_datetime(df[date_col], format='ISO8601', errors='coerce')
+            
+            for col in CATEGORICAL_COLUMNS:
+                if col in df.columns:
+                    df[col] = df[col].astype('category')
             
             sort_col = 'end_date' if 'end_date' in df.columns else 'instant_date'
             df = df.sort_values([sort_col, 'tag', 'segment'], ascending=[True, True, True])
@@ -753,26 +1258,30 @@ class ComprehensiveXBRLExtractor:
                 logger.info(f"Removed {before - len(df)} exact duplicate facts")
 
             logger.info(f"\nTotal facts extracted: {len(df)}")
+            
+            if self.cache and complete:
+                self._cache_write('frames', frame_key, pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL))
         
         return df
 
     # -------------------------------------------------------------------------
     # Q4 Calculation Logic (YTD-aware)
     # -------------------------------------------------------------------------
-    def _is_calendar_ytd(self, row):
-        """Determine if a period is YTD for calendar fiscal year"""
-        s = row.get('start_date')
-        e = row.get('end_date')
-        if pd.isna(s) or pd.isna(e):
-            return False
-        # Calendar FY: starts Jan 1 and ends in same year
-        return s.month == 1 and s.day == 1 and s.year == e.year
+    def _calendar_ytd_mask(self, df):
+        """Boolean mask of rows whose period is YTD for a calendar fiscal year"""
+        start = df['start_date']
+        end = df['end_date']
+        # Calendar FY: starts Jan 1 and ends in same year (missing dates -> False)
+        return start.dt.month.eq(1) & start.dt.day.eq(1) & start.dt.year.eq(end.dt.year)
 
     def calculate_q4_data(self, df):
         """
         Calculate Q4 data using YTD-aware logic:
         - Balance sheet: Copy 10-K instant values
         - Flow statements: Annual - Q3 (YTD) or Annual - sum(Q1+Q2+Q3)
+        
+        Annual rows are matched to their fiscal-year quarters with a single
+        merge on (tag, segment, fiscal_year) and aggregated per annual row.
         """
         logger.info("\n" + "=" * 60)
         logger.info("Calculating Q4 data")
@@ -781,127 +1290,108 @@ class ComprehensiveXBRLExtractor:
         if df.empty:
             return df
         
-        quarterly_df = df[df['form'] == '10-Q'].copy()
-        annual_df = df[df['form'] == '10-K'].copy()
-        
-        q4_records = []
-        unique_tags = df['tag'].dropna().unique()
-        unique_segments = df['segment'].dropna().unique().tolist()
-        
-        if 'Consolidated' not in unique_segments:
-            unique_segments.append('Consolidated')
-        
-        for tag in unique_tags:
-            for segment in unique_segments:
-                # Get annual data for this tag/segment combination
-                annual_subset = annual_df[
-                    (annual_df['tag'] == tag) &
-                    ((annual_df['segment'] == segment) |
-                     (segment == 'Consolidated' and annual_df['segment'].isna()))
-                ].copy()
-                
-                for _, annual_row in annual_subset.iterrows():
-                    # Get the business_segment of this annual row (if any)
-                    biz_seg = annual_row.get('business_segment')
-                    
-                    # Balance sheet items (instant dates)
-                    is_balance_sheet = pd.notna(annual_row.get('instant_date'))
-                    
-                    if is_balance_sheet:
-                        fiscal_year_end = annual_row['instant_date']
-                        if pd.isna(fiscal_year_end):
-                            continue
-                        
-                        q4_records.append({
-                            'tag': tag,
-                            'value': annual_row['value'],
-                            'segment': segment,
-                            'business_segment': annual_row.get('business_segment'),
-                            'start_date': None,
-                            'end_date': None,
-                            'instant_date': fiscal_year_end,
-                            'report_date': fiscal_year_end,
-                            'form': '10-K (Q4)',
-                            'accession': annual_row['accession'],
-                            'filing_date': annual_row['filing_date'],
-                            'context_id': f"Q4_{fiscal_year_end.year}_{segment}",
-                            'dimension': annual_row.get('dimension'),
-                            'decimals': annual_row.get('decimals'),
-                            'unit': annual_row.get('unit'),
-                        })
-                        continue
-                    
-                    # Flow statement items (period data)
-                    fiscal_year_end = annual_row['end_date']
-                    if pd.isna(fiscal_year_end):
-                        continue
-                    
-                    fiscal_year = fiscal_year_end.year
-                    
-                    # Get quarterly data for this fiscal year
-                    q_subset = quarterly_df[
-                        (quarterly_df['tag'] == tag) &
-                        ((quarterly_df['segment'] == segment) |
-                         (segment == 'Consolidated' and quarterly_df['segment'].isna())) &
-                        (quarterly_df['end_date'] > pd.Timestamp(year=fiscal_year - 1, month=12, day=31)) &
-                        (quarterly_df['end_date'] <= fiscal_year_end)
-                    ].copy()
-                    
-                    # If this annual row has a business_segment, filter quarterly data to match
-                    if pd.notna(biz_seg) and biz_seg:
-                        q_biz = q_subset[q_subset['business_segment'] == biz_seg]
-                        if not q_biz.empty:
-                            q_subset = q_biz
-                        # else fall back to unfiltered (for backward compatibility)
-                    
-                    if q_subset.empty:
-                        continue
-                    
-                    # Detect YTD reporting
-                    q_subset['is_ytd'] = q_subset.apply(self._is_calendar_ytd, axis=1)
-                    
-                    annual_total = annual_row['value']
-                    q3_end = q_subset['end_date'].max()
-                    
-                    # Calculate Q4 value
-                    if q_subset['is_ytd'].any():
-                        # YTD reporting: Q4 = Annual - Latest YTD (typically Q3)
-                        latest_ytd = q_subset.sort_values('end_date').iloc[-1]
-                        q4_value = annual_total - latest_ytd['value']
-                    else:
-                        # Discrete quarters: Q4 = Annual - sum(available quarters)
-                        sum_quarters = q_subset['value'].sum()
-                        q4_value = annual_total - sum_quarters
-                        if len(q_subset) != 3:
-                            logger.warning(
-                                f"Discrete quarterly data incomplete for {tag} ({segment}) FY{fiscal_year}: "
-                                f"have {len(q_subset)} quarters; Q4 computed as Annual - sum(available)"
-                            )
-                    
-                    q4_records.append({
-                        'tag': tag,
-                        'value': q4_value,
-                        'segment': segment,
-                        'business_segment': annual_row.get('business_segment'),
-                        'start_date': q3_end + pd.Timedelta(days=1) if pd.notna(q3_end) else None,
-                        'end_date': fiscal_year_end,
-                        'instant_date': None,
-                        'report_date': fiscal_year_end,
-                        'form': '10-Q (Q4 Calculated)',
-                        'accession': annual_row['accession'],
-                        'filing_date': annual_row['filing_date'],
-                        'context_id': f"Q4_{fiscal_year}_{segment}",
-                        'dimension': annual_row.get('dimension'),
-                        'decimals': annual_row.get('decimals'),
-                        'unit': annual_row.get('unit'),
-                    })
-        
-        if q4_records:
-            q4_df = pd.DataFrame(q4_records)
+        # Rows without a segment belong to the consolidated totals
+        facts = df[df['tag'].notna()].assign(segment=lambda d: _fillna_category(d['segment'], 'Consolidated'))
+        annual_df = facts[facts['form'] == '10-K']
+        quarterly_df = facts[(facts['form'] == '10-Q') & facts['end_date'].notna()]
+        
+        q4_parts = []
+        
+        # --- Balance sheet items (instant dates): copy the 10-K values ---
+        balance = annual_df[annual_df['instant_date'].notna()]
+        if not balance.empty:
+            q4_parts.append(pd.DataFrame({
+                'tag': balance['tag'],
+                'value': balance['value'],
+                'segment': balance['segment'],
+                'business_segment': balance['business_segment'],
+                'start_date': pd.NaT,
+                'end_date': pd.NaT,
+                'instant_date': balance['instant_date'],
+                'report_date': balance['instant_date'],
+                'form': '10-K (Q4)',
+                'accession': balance['accession'],
+                'filing_date': balance['filing_date'],
+                'context_id': 'Q4_' + balance['instant_date'].dt.year.astype(str) + '_' + balance['segment'].astype(str),
+                'dimension': balance['dimension'],
+                'decimals': balance['decimals'],
+                'unit': balance['unit'],
+            }))
+        
+        # --- Flow statement items (period data) ---
+        flow = annual_df[annual_df['instant_date'].isna() & annual_df['end_date'].notna()]
+        if not flow.empty and not quarterly_df.empty:
+            flow = flow.assign(_annual_pos=np.arange(len(flow)), fiscal_year=flow['end_date'].dt.year)
+            
+            quarters = quarterly_df[['tag', 'segment', 'business_segment', 'start_date', 'end_date', 'value']]
+            quarters = quarters.assign(
+                _q_pos=np.arange(len(quarters)),
+                fiscal_year=quarters['end_date'].dt.year,
+                is_ytd=self._calendar_ytd_mask(quarters),
+            )
+            
+            # Quarterly data for each annual row's fiscal year: (Dec 31 of prior year, FY end]
+            pairs = flow[['_annual_pos', 'tag', 'segment', 'business_segment', 'fiscal_year', 'end_date']].merge(
+                quarters, on=['tag', 'segment', 'fiscal_year'], suffixes=('_annual', '')
+            )
+            pairs = pairs[pairs['end_date'] <= pairs['end_date_annual']]
+            
+            # If the annual row has a business_segment, keep only matching quarters
+            # (falls back to unfiltered when none match, for backward compatibility)
+            annual_biz = pairs['business_segment_annual']
+            biz_match = annual_biz.notna() & (annual_biz != '') & (pairs['business_segment'] == annual_biz)
+            any_biz_match = biz_match.groupby(pairs['_annual_pos']).transform('any')
+            pairs = pairs[~any_biz_match | biz_match]
+            
+            # Latest quarter = last row with the max end_date, in original row order
+            pairs = pairs.sort_values(['_annual_pos', 'end_date', '_q_pos'])
+            grouped = pairs.groupby('_annual_pos')
+            agg = pd.DataFrame({
+                'any_ytd': grouped['is_ytd'].any(),
+                'q3_end': grouped['end_date'].max(),
+                'sum_quarters': grouped['value'].sum(),
+                'n_quarters': grouped.size(),
+                'latest_value': pairs.drop_duplicates('_annual_pos', keep='last').set_index('_annual_pos')['value'],
+            })
+            flow = flow.join(agg, on='_annual_pos', how='inner')
+            
+            # YTD reporting: Q4 = Annual - Latest YTD (typically Q3)
+            # Discrete quarters: Q4 = Annual - sum(available quarters)
+            subtracted = np.where(flow['any_ytd'], flow['latest_value'], flow['sum_quarters'])
+            
+            incomplete = flow[~flow['any_ytd'] & (flow['n_quarters'] != 3)]
+            for row in incomplete.itertuples():
+                logger.warning(
+                    f"Discrete quarterly data incomplete for {row.tag} ({row.segment}) FY{row.fiscal_year}: "
+                    f"have {row.n_quarters} quarters; Q4 computed as Annual - sum(available)"
+                )
+            
+            q4_parts.append(pd.DataFrame({
+                'tag': flow['tag'],
+                'value': flow['value'] - subtracted,
+                'segment': flow['segment'],
+                'business_segment': flow['business_segment'],
+                'start_date': flow['q3_end'] + pd.Timedelta(days=1),
+                'end_date': flow['end_date'],
+                'instant_date': pd.NaT,
+                'report_date': flow['end_date'],
+                'form': '10-Q (Q4 Calculated)',
+                'accession': flow['accession'],
+                'filing_date': flow['filing_date'],
+                'context_id': 'Q4_' + flow['fiscal_year'].astype(str) + '_' + flow['segment'].astype(str),
+                'dimension': flow['dimension'],
+                'decimals': flow['decimals'],
+                'unit': flow['unit'],
+            }))
+        
+        q4_df = pd.concat(q4_parts, ignore_index=True) if q4_parts else pd.DataFrame()
+        if not q4_df.empty:
             combined = pd.concat([df, q4_df], ignore_index=True)
+            # The added Q4 form labels turn the concatenated column back into strings
+            combined['form'] = combined['form'].astype('category')
             if 'end_date' in combined.columns:
                 combined = combined.sort_values(['end_date', 'instant_date', 'tag', 'segment'])
-            logger.info(f"Added {len(q4_records)} Q4 records")
+            logger.info(f"Added {len(q4_df)} Q4 records")
             return combined
         
         return df
@@ -915,28 +1405,28 @@ class ComprehensiveXBRLExtractor:
         if df_quarters.empty:
             return df_quarters
         
-        q = df_quarters.copy()
-        q = q[q['form'].str.contains('10-Q', na=False)]
-        q = q[q['end_date'].notna()].copy()
-        q['segment'] = q['segment'].fillna('Consolidated')
-        q['fiscal_year'] = q['end_date'].dt.year
-        q['is_ytd'] = q.apply(self._is_calendar_ytd, axis=1)
+        q = df_quarters[_contains_mask(df_quarters['form'], '10-Q') & df_quarters['end_date'].notna().to_numpy()]
+        q = q.assign(
+            segment=_fillna_category(q['segment'], 'Consolidated'),
+            fiscal_year=q['end_date'].dt.year,
+            is_ytd=self._calendar_ytd_mask(q),
+        )
         
         # Include business_segment in groupby to avoid mixing segment data during diff
         if 'business_segment' not in q.columns:
             q['business_segment'] = None
-        q['_biz_seg_key'] = q['business_segment'].fillna('__none__')
-        
-        q = q.sort_values(['tag', 'segment', '_biz_seg_key', 'fiscal_year', 'end_date'])
-        
-        # Normalize YTD to discrete per group (avoids FutureWarning from groupby.apply)
-        result_parts = []
-        for _, g in q.groupby(['tag', 'segment', '_biz_seg_key', 'fiscal_year'], group_keys=False):
-            if g['is_ytd'].any():
-                g = g.sort_values('end_date').copy()
-                g['value'] = g['value'].diff().fillna(g['value'])
-            result_parts.append(g)
-        q = pd.concat(result_parts, ignore_index=True) if result_parts else q
+        q['_biz_seg_key'] = _fillna_category(q['business_segment'], '__none__')
+        
+        group_keys = ['tag', 'segment', '_biz_seg_key', 'fiscal_year']
+        q = q.sort_values(group_keys + ['end_date']).reset_index(drop=True)
+        
+        # Normalize YTD to discrete per group with two Cython groupby passes:
+        # value - previous value within the group, group starts keep the reported value
+        grouped = q.groupby(group_keys, sort=False, dropna=False, observed=True)
+        group_has_ytd = grouped['is_ytd'].transform('any').astype(bool)
+        discrete = grouped['value'].diff().fillna(q['value'])
+        q['value'] = q['value'].where(~group_has_ytd, discrete)
+        
         q = q.drop(columns=['_biz_seg_key'])
         return q
 
@@ -948,115 +1438,103 @@ class ComprehensiveXBRLExtractor:
         if df.empty:
             return pd.DataFrame()
         
-        statement_items = self._get_statement_items(statement_type)
+        plan = self._statement_plans.get(statement_type)
+        if plan is None:
+            logger.warning(f"Unknown statement type: {statement_type}")
+            return pd.DataFrame()
         
         # Determine date column based on statement type
         if statement_type == 'balance':
             date_col = 'instant_date'
-            df_filtered = df[df['instant_date'].notna()].copy()
+            df_filtered = df[df['instant_date'].notna()]
         else:
             date_col = 'end_date'
-            df_filtered = df[df['end_date'].notna()].copy()
+            df_filtered = df[df['end_date'].notna()]
         
         if df_filtered.empty:
             return pd.DataFrame()
         
         # Filter to quarterly data only (includes "10-Q (Q4 Calculated)")
-        df_filtered = df_filtered[df_filtered['form'].str.contains('10-Q', na=False)].copy()
+        df_filtered = df_filtered[_contains_mask(df_filtered['form'], '10-Q')]
         
         # For cash flow: normalize Q1/Q2/Q3 to discrete, keep Q4 Calculated as-is
         if statement_type == 'cashflow':
-            is_q4_calc = df_filtered['form'].str.contains('Q4 Calculated', na=False)
-            q4_calc = df_filtered[is_q4_calc].copy()
-            q10 = df_filtered[~is_q4_calc].copy()
-            q10 = self._normalize_quarters_to_discrete(q10)
-            df_filtered = pd.concat([q10, q4_calc], ignore_index=True)
-        
-        df_filtered['segment'] = df_filtered['segment'].fillna('Consolidated')
-        
-        # Get candidate tag maps
-        income_map = self._get_income_tag_candidates() if statement_type == 'income' else {}
-        balance_map = self._get_balance_tag_candidates() if statement_type == 'balance' else {}
-        cash_map = self._get_cashflow_tag_candidates() if statement_type == 'cashflow' else {}
-        
-        # Segment suffix mapping
-        segment_map = {
-            'FinancialProducts': 'FinancialProductsMember',
-            'MET': 'MachineryEnergyTransportationMember',
-            'EXFP': 'AllOtherExcludingFinancialProductsMember',
-            'Total': 'Consolidated',
-        }
+            is_q4_calc = _contains_mask(df_filtered['form'], 'Q4 Calculated')
+            q10 = self._normalize_quarters_to_discrete(df_filtered[~is_q4_calc])
+            df_filtered = pd.concat([q10, df_filtered[is_q4_calc]], ignore_index=True)
+        
+        df_filtered = df_filtered.assign(segment=_fillna_category(df_filtered['segment'], 'Consolidated'))
+        
+        # Inverted indexes: tag -> row positions and (tag, segment) -> row positions,
+        # built once so each candidate lookup is a hash hit instead of a full-frame scan
+        tag_rows = df_filtered.groupby('tag', sort=False, observed=True).indices
+        tag_segment_rows = df_filtered.groupby(['tag', 'segment'], sort=False, observed=True).indices
+        
+        def rows_for_tag(tag, segments=None):
+            if segments is None:
+                positions = tag_rows.get(tag)
+            else:
+                parts = [tag_segment_rows[(tag, seg)] for seg in segments if (tag, seg) in tag_segment_rows]
+                positions = np.sort(np.concatenate(parts)) if parts else None
+            if positions is None:
+                return df_filtered.iloc[0:0]
+            return df_filtered.iloc[positions]
+        
+        # Distinct segment names, so the case-insensitive fallback below tests each
+        # name once and then reuses the (tag, segment) index instead of scanning rows
+        segment_names = pd.Series(df_filtered['segment'].dropna().unique(), dtype=object).astype(str)
+        segments_containing = {}
+        
+        def matching_segments(target):
+            if target not in segments_containing:
+                hits = segment_names.str.contains(target, case=False, regex=False)
+                segments_containing[target] = segment_names[hits].tolist()
+            return segments_containing[target]
         
         pivot_data = []
         
-        for tag_key, label in statement_items.items():
+        for label, candidate_tags, target_segment in plan:
             # Handle blank label rows (section headers)
-            if tag_key == '':
+            if candidate_tags is None:
                 pivot_data.append({'Line_Item': label})
                 continue
             
-            # Extract base tag and optional segment suffix
-            parts = tag_key.split('_', 1)
-            base_key = parts[0]
-            segment_suffix = parts[1] if len(parts) > 1 else None
-            
-            # Determine candidate tags based on statement type
-            if statement_type == 'income':
-                candidate_tags = income_map.get(base_key, [base_key])
-            elif statement_type == 'balance':
-                candidate_tags = balance_map.get(base_key, [base_key if segment_suffix else tag_key])
-            elif statement_type == 'cashflow':
-                candidate_tags = cash_map.get(base_key, [base_key if segment_suffix else tag_key])
-            else:
-                candidate_tags = [tag_key]
-            
             selected_subset = pd.DataFrame()
             
             # Find data matching the tag and segment
-            if segment_suffix:
-                target_segment = segment_map.get(segment_suffix, segment_suffix)
+            if target_segment is not None:
                 # Try exact match first
                 for cand in candidate_tags:
-                    sub = df_filtered[
-                        (df_filtered['tag'] == cand) & 
-                        (df_filtered['segment'] == target_segment)
-                    ]
+                    sub = rows_for_tag(cand, [target_segment])
                     if not sub.empty:
                         selected_subset = sub
                         break
                 
                 # Fallback: case-insensitive contains
                 if selected_subset.empty:
+                    similar_segments = matching_segments(target_segment)
                     for cand in candidate_tags:
-                        sub = df_filtered[
-                            (df_filtered['tag'] == cand) &
-                            (df_filtered['segment'].str.contains(target_segment, case=False, na=False))
-                        ]
+                        sub = rows_for_tag(cand, similar_segments)
                         if not sub.empty:
                             selected_subset = sub
                             break
             else:
                 # Consolidated data (no segment)
                 for cand in candidate_tags:
-                    sub = df_filtered[
-                        (df_filtered['tag'] == cand) &
-                        (df_filtered['segment'].isin(['Consolidated', '']))
-                    ]
+                    sub = rows_for_tag(cand, ['Consolidated', ''])
                     if not sub.empty:
                         selected_subset = sub
                         break
             
-            # Create pivot row if data found
+            # Create pivot row if data found: the subset holds a single tag, so the
+            # first value per date is all pivot_table(aggfunc='first') would give
             if not selected_subset.empty:
-                pv = selected_subset.pivot_table(
-                    index='tag', 
-                    columns=date_col, 
-                    values='value', 
-                    aggfunc='first'
+                first = selected_subset.dropna(subset=[date_col, 'value']).drop_duplicates(
+                    subset=['tag', date_col], keep='first'
                 )
-                if not pv.empty:
+                if not first.empty:
                     row = {'Line_Item': label}
-                    row.update(pv.iloc[0].to_dict())
+                    row.update(zip(first[date_col], first['value']))
                     pivot_data.append(row)
         
         if not pivot_data:
@@ -1077,6 +1555,11 @@ class ComprehensiveXBRLExtractor:
             else:
                 formatted.append(col)
         result_df.columns = formatted
+        # Quarter labels straight from the Timestamps, so format_excel_sheet
+        # does not have to parse the formatted names again
+        result_df.attrs['quarters'] = [
+            f"Q{(col.month - 1) // 3 + 1}" if isinstance(col, pd.Timestamp) else '' for col in ['Line_Item'] + date_cols_sorted
+        ]
         
         return result_df
 
@@ -1098,6 +1581,70 @@ class ComprehensiveXBRLExtractor:
                 'SegmentExpenditureAdditionToLongLivedAssets'],
         }
 
+    @cached_property
+    def _segment_items(self):
+        """Segment line items, built once per extractor"""
+        return self._get_segment_items()
+
+    @cached_property
+    def _segment_tag_remap(self):
+        """
+        (tag -> canonical tag, tag -> candidate rank) for segment items that have
+        alternate tags; rank 0 is the canonical tag itself. Built once per extractor.
+        """
+        tag_to_canon = {}
+        tag_rank = {}
+        for canonical_tag, candidates in self._get_segment_tag_candidates().items():
+            if len(candidates) <= 1:
+                continue
+            for rank, cand in enumerate(candidates):
+                tag_to_canon[cand] = canonical_tag
+                tag_rank[cand] = rank
+        return tag_to_canon, tag_rank
+
+    @cached_property
+    def _statement_plans(self):
+        """
+        Parsed statement line items per statement type, built once per extractor.
+        
+        Each plan is a list of (label, candidate_tags, target_segment) in display
+        order: candidate_tags is None for label-only rows, and target_segment is
+        None for consolidated items ('<Tag>' keys, as opposed to '<Tag>_<suffix>').
+        """
+        candidate_maps = {
+            'income': self._get_income_tag_candidates(),
+            'balance': self._get_balance_tag_candidates(),
+            'cashflow': self._get_cashflow_tag_candidates(),
+        }
+        plans = {}
+        for statement_type, tag_map in candidate_maps.items():
+            plan = []
+            for tag_key, label in self._get_statement_items(statement_type).items():
+                if tag_key == '':
+                    plan.append((label, None, None))
+                    continue
+                # Extract base tag and optional segment suffix
+                base_key, _, segment_suffix = tag_key.partition('_')
+                target_segment = self.STATEMENT_SEGMENT_MAP.get(segment_suffix, segment_suffix) if segment_suffix else None
+                plan.append((label, tuple(tag_map.get(base_key, [base_key])), target_segment))
+            plans[statement_type] = plan
+        return plans
+
+    @cached_property
+    def _wanted_tags(self):
+        """Every XBRL tag a statement or segment sheet can read, built once per extractor"""
+        wanted = set(self._get_segment_items())
+        for statement_type in ('income', 'balance', 'cashflow'):
+            for tag_key in self._get_statement_items(statement_type):
+                wanted.add(tag_key)
+                wanted.add(tag_key.split('_', 1)[0])
+        for catalog in (self._get_income_tag_candidates(), self._get_balance_tag_candidates(),
+                        self._get_cashflow_tag_candidates(), self._get_segment_tag_candidates()):
+            for candidates in catalog.values():
+                wanted.update(candidates)
+        wanted.discard('')
+        return frozenset(wanted)
+
     def _extract_discrete_quarters(self, flow_df):
         """Extract discrete quarterly values from flow data that may contain both
         discrete (3-month) and YTD (6-month, 9-month) values.
@@ -1110,31 +1657,33 @@ class ComprehensiveXBRLExtractor:
         if flow_df.empty:
             return flow_df
         
-        q = flow_df.copy()
-        q = q[q['start_date'].notna() & q['end_date'].notna()].copy()
+        q = flow_df[flow_df['start_date'].notna() & flow_df['end_date'].notna()]
         
         if q.empty:
             return flow_df
         
-        # Compute period length in days
-        q['_period_days'] = (q['end_date'] - q['start_date']).dt.days
+        # Compute period length in days on the int64 nanosecond values
+        end_ns = q['end_date'].to_numpy(dtype='datetime64[ns]').view('int64')
+        start_ns = q['start_date'].to_numpy(dtype='datetime64[ns]').view('int64')
+        period_days = (end_ns - start_ns) // np.int64(86_400_000_000_000)
         
         # Discrete quarters: ~90 days (allow up to 100 for slight variations)
         # YTD periods: H1 ~180 days, 9M ~270 days
-        discrete_mask = q['_period_days'] <= 100
-        discrete_df = q[discrete_mask].copy()
-        ytd_df = q[~discrete_mask].copy()
+        discrete_mask = period_days <= 100
+        discrete_df = q[discrete_mask]
+        ytd_df = q[~discrete_mask]
         
         if not discrete_df.empty:
             # We have discrete values — use them
             # Check if any (tag, end_date) combos are missing discrete but have YTD
-            discrete_keys = set(zip(discrete_df['tag'], discrete_df['end_date']))
+            discrete_keys = pd.MultiIndex.from_arrays(
+                [discrete_df['tag'].to_numpy(), discrete_df['end_date'].to_numpy()]
+            )
             
             if not ytd_df.empty:
                 # Keep only YTD rows for periods NOT covered by discrete data
-                ytd_needed = ytd_df[~ytd_df.apply(
-                    lambda r: (r['tag'], r['end_date']) in discrete_keys, axis=1
-                )]
+                ytd_keys = pd.MultiIndex.from_arrays([ytd_df['tag'].to_numpy(), ytd_df['end_date'].to_numpy()])
+                ytd_needed = ytd_df[~ytd_keys.isin(discrete_keys)]
                 if not ytd_needed.empty:
                     # Normalize YTD-only periods to discrete
                     ytd_needed = self._normalize_quarters_to_discrete(ytd_needed)
@@ -1147,7 +1696,6 @@ class ComprehensiveXBRLExtractor:
             # Only YTD data — normalize via diff
             result = self._normalize_quarters_to_discrete(ytd_df)
         
-        result = result.drop(columns=['_period_days'], errors='ignore')
         return result
 
     def create_segment_pivot(self, df, segment_member):
@@ -1162,130 +1710,118 @@ class ComprehensiveXBRLExtractor:
         if df.empty:
             return pd.DataFrame()
         
-        segment_items = self._get_segment_items()
-        tag_candidates = self._get_segment_tag_candidates()
+        segment_items = self._segment_items
+        tag_to_canon, tag_rank = self._segment_tag_remap
         
         # Balance-sheet-like items (point-in-time) vs flow items
         instant_tags = {'Assets'}
         
         # Merge: rows where segment==segment_member OR business_segment==segment_member
-        mask_direct = df['segment'] == segment_member
-        mask_biz = df['business_segment'] == segment_member
-        seg_df = df[mask_direct | mask_biz].copy()
+        # (masks combined as plain bool arrays, one slice of df)
+        seg_mask = (df['segment'] == segment_member).to_numpy() | (df['business_segment'] == segment_member).to_numpy()
+        seg_df = df[seg_mask]
         
         if seg_df.empty:
             logger.warning(f"No data found for segment: {segment_member}")
             return pd.DataFrame()
         
         seg_df = seg_df.drop_duplicates()
+        if isinstance(seg_df['tag'].dtype, pd.CategoricalDtype):
+            # Alternate tags are remapped in place below, so every canonical tag must be a category
+            missing = [tag for tag in sorted(set(tag_to_canon.values())) if tag not in seg_df['tag'].cat.categories]
+            seg_df['tag'] = seg_df['tag'].cat.add_categories(missing)
         # Resolve candidate tags: for each segment item, find the best matching
-        # XBRL tag and remap to the canonical key
-        for canonical_tag, candidates in tag_candidates.items():
-            if len(candidates) <= 1:
-                continue
-            # Check which candidate tags have data
-            for alt_tag in candidates[1:]:  # Skip first (it IS the canonical)
-                alt_mask = seg_df['tag'] == alt_tag
-                if alt_mask.any():
-                    # Check if canonical already has data for the same periods
-                    canon_mask = seg_df['tag'] == canonical_tag
-                    if not canon_mask.any():
-                        # No canonical data — remap alt to canonical
-                        seg_df.loc[alt_mask, 'tag'] = canonical_tag
-                    else:
-                        # Both exist — remap alt rows for periods where canonical is missing
-                        canon_dates = set(seg_df.loc[canon_mask, 'end_date'].dropna())
-                        alt_new = alt_mask & ~seg_df['end_date'].isin(canon_dates)
-                        seg_df.loc[alt_new, 'tag'] = canonical_tag
-        
-        # Filter to quarterly data (10-Q and Q4 calculated)
-        seg_df = seg_df[seg_df['form'].str.contains('10-Q', na=False)].copy()
+        # XBRL tag and remap to the canonical key. An alternate tag row is
+        # remapped unless a higher-priority candidate (canonical first, then
+        # earlier alternates) already has data for the same end_date
+        tags = seg_df['tag'].astype(object)
+        ranks = tags.map(tag_rank)
+        canon = tags.map(tag_to_canon)
+        best_rank = ranks.groupby([canon, seg_df['end_date']]).transform('min')
+        remap = (ranks > 0) & (seg_df['end_date'].isna() | (ranks == best_rank))
+        if remap.any():
+            seg_df.loc[remap, 'tag'] = canon[remap]
+        
+        # Filter to quarterly data (10-Q and Q4 calculated). This stays after the
+        # remap above, which also looks at 10-K rows when deciding canonical periods
+        seg_df = seg_df[_contains_mask(seg_df['form'], '10-Q')]
         
         if seg_df.empty:
             return pd.DataFrame()
         
-        # Add source priority: direct segment tags (priority 0) beat
-        # multi-dimensional OperatingSegmentsMember tags (priority 1)
-        seg_df['_src_priority'] = 1  # default: multi-dim
-        seg_df.loc[seg_df['segment'] == segment_member, '_src_priority'] = 0  # direct
-        seg_df = seg_df.sort_values('_src_priority')
+        # Source priority: direct segment tags (priority 0) beat
+        # multi-dimensional OperatingSegmentsMember tags (priority 1).
+        # Ordered with a stable argsort of the priority array, so ties keep
+        # filing order and do not depend on which other tags were parsed
+        src_priority = np.where(seg_df['segment'] == segment_member, 0, 1)
+        seg_df = seg_df.take(np.argsort(src_priority, kind='stable'))
         
         # Unify the segment field: all rows in this pivot belong to the same 
         # business segment, so normalize segment to avoid split groups
         seg_df['segment'] = segment_member
         
+        # Both dedup passes share tag + dates, so factorize each key column once
+        # and run the duplicate checks on the small integer codes
+        key_codes = pd.DataFrame({
+            col: pd.factorize(seg_df[col])[0]
+            for col in ('tag', 'value', 'start_date', 'end_date', 'instant_date', 'form')
+        })
         # Deduplicate: if both direct and multi-dimensional sources have same 
-        # tag + period, keep the direct one (lower priority number = first)
-        seg_df = seg_df.drop_duplicates(
-            subset=['tag', 'start_date', 'end_date', 'instant_date', 'form'], 
-            keep='first'
-        )
+        # tag + period, keep the direct one (sorted first)
+        keep = ~key_codes.duplicated(subset=['tag', 'start_date', 'end_date', 'instant_date', 'form'], keep='first').to_numpy()
         # Also catch exact duplicate facts (same tag+value+dates from different contexts)
-        seg_df = seg_df.drop_duplicates(
-        subset=['tag', 'value', 'start_date', 'end_date', 'instant_date'], 
-        keep='first'
-        )
-        seg_df = seg_df.drop(columns=['_src_priority'])
+        keep[keep] = ~key_codes[keep].duplicated(
+            subset=['tag', 'value', 'start_date', 'end_date', 'instant_date'], keep='first'
+        ).to_numpy()
+        seg_df = seg_df[keep]
         
         # --- Handle flow items: extract discrete quarters ---
         is_instant_tag = seg_df['tag'].isin(instant_tags)
-        instant_df = seg_df[is_instant_tag].copy()
-        flow_df = seg_df[~is_instant_tag].copy()
+        flow_df = seg_df[~is_instant_tag]
+        parts = [seg_df[is_instant_tag]]
         
         if not flow_df.empty:
-            is_q4_calc = flow_df['form'].str.contains('Q4 Calculated', na=False)
-            q4_calc = flow_df[is_q4_calc].copy()
-            q10 = flow_df[~is_q4_calc].copy()
+            is_q4_calc = _contains_mask(flow_df['form'], 'Q4 Calculated')
+            q10 = flow_df[~is_q4_calc]
             
             # Use discrete-aware extraction instead of blind YTD normalization
             if not q10.empty:
                 q10 = self._extract_discrete_quarters(q10)
-            flow_df = pd.concat([q10, q4_calc], ignore_index=True)
+            parts += [q10, flow_df[is_q4_calc]]
         
-        # Recombine
-        seg_df = pd.concat([instant_df, flow_df], ignore_index=True)
+        # Recombine instant, discrete and Q4 rows in one concat
+        seg_df = pd.concat(parts, ignore_index=True, copy=False)
         
         # --- Build pivot rows ---
-        pivot_data = []
-        
-        for tag_key, label in segment_items.items():
-            if tag_key == '':
-                pivot_data.append({'Line_Item': label})
-                continue
-            
-            is_instant = tag_key in instant_tags
-            date_col = 'instant_date' if is_instant else 'end_date'
-            
-            sub = seg_df[seg_df['tag'] == tag_key].copy()
-            
-            if sub.empty:
-                continue
-            
-            # Deduplicate: keep one value per date
-            sub = sub.dropna(subset=[date_col])
-            sub = sub.drop_duplicates(subset=['tag', date_col], keep='first')
-            
-            pv = sub.pivot_table(
-                index='tag',
-                columns=date_col,
-                values='value',
-                aggfunc='first'
-            )
-            
-            if not pv.empty:
-                row = {'Line_Item': label}
-                row.update(pv.iloc[0].to_dict())
-                pivot_data.append(row)
-        
-        if not pivot_data:
+        # One grouped reduction for all line items: instant tags are keyed by
+        # instant_date, flow tags by end_date, first value per (tag, date) wins
+        item_tags = [tag_key for tag_key in segment_items if tag_key != '']
+        items_df = seg_df[seg_df['tag'].isin(item_tags).to_numpy()]
+        is_instant = items_df['tag'].isin(instant_tags).to_numpy()
+        items_df = pd.DataFrame({
+            'tag': items_df['tag'].astype(object).to_numpy(),
+            'date': np.where(is_instant, items_df['instant_date'], items_df['end_date']),
+            'value': items_df['value'].to_numpy(),
+        }).dropna(subset=['date'])
+        # Deduplicate: keep one value per date
+        items_df = items_df.drop_duplicates(subset=['tag', 'date'], keep='first').dropna(subset=['value'])
+        table = items_df.set_index(['tag', 'date'])['value'].unstack('date')
+        
+        # Header rows ('' keys) and items with data, in segment_items order
+        rows = [(tag_key, label) for tag_key, label in segment_items.items()
+                if tag_key == '' or tag_key in table.index]
+        if not rows:
             return pd.DataFrame()
         
-        result_df = pd.DataFrame(pivot_data)
-        
-        # Sort columns by date (Oldest first)
-        date_cols = [c for c in result_df.columns if c != 'Line_Item']
-        date_cols_sorted = sorted(date_cols)
-        result_df = result_df[['Line_Item'] + date_cols_sorted]
+        # Fill one preallocated (items x dates) matrix: each row is taken from
+        # the table by position, header rows index the trailing all-NaN row.
+        # unstack already sorted the date columns (oldest first)
+        date_cols_sorted = list(table.columns)
+        values = np.full((len(table) + 1, len(date_cols_sorted)), np.nan)
+        values[:-1] = table.to_numpy(dtype=float)
+        positions = table.index.get_indexer([tag_key for tag_key, _ in rows])
+        result_df = pd.DataFrame(values[positions], columns=date_cols_sorted)
+        result_df.insert(0, 'Line_Item', [label for _, label in rows])
         
         # Format datetime column names
         formatted = []
@@ -1295,96 +1831,178 @@ class ComprehensiveXBRLExtractor:
             else:
                 formatted.append(col)
         result_df.columns = formatted
+        # Quarter labels straight from the Timestamps, so format_excel_sheet
+        # does not have to parse the formatted names again
+        result_df.attrs['quarters'] = [
+            f"Q{(col.month - 1) // 3 + 1}" if isinstance(col, pd.Timestamp) else '' for col in ['Line_Item'] + date_cols_sorted
+        ]
         
         return result_df
 
+    def _create_segment_pivot_with_fallback(self, df, member_name):
+        """Segment pivot, retrying Financial Products under its alternate member name"""
+        seg_pivot = self.create_segment_pivot(df, member_name)
+        # Fallback: Financial Products may use alternate member name
+        if seg_pivot.empty and 'FinancialProducts' in member_name:
+            alt_name = 'FinancialProductsMember' if member_name == 'FinancialProductsSegmentMember' else 'FinancialProductsSegmentMember'
+            logger.info(f"  Trying alternate member: {alt_name}")
+            seg_pivot = self.create_segment_pivot(df, alt_name)
+        return seg_pivot
+
     # -------------------------------------------------------------------------
     # Excel Formatting
     # -------------------------------------------------------------------------
-    def _get_quarter_from_date(self, date_str):
-        """Determine quarter label from date string"""
-        try:
-            date_obj = pd.to_datetime(date_str) if isinstance(date_str, str) else date_str
-            m = date_obj.month
-            if m in [1, 2, 3]:
-                return 'Q1'
-            elif m in [4, 5, 6]:
-                return 'Q2'
-            elif m in [7, 8, 9]:
-                return 'Q3'
-            elif m in [10, 11, 12]:
-                return 'Q4'
-            else:
-                return ''
-        except Exception:
-            return ''
+    def _get_quarter_labels(self, columns):
+        """Quarter label ('Q1'..'Q4') for each date column header, '' for anything else"""
+        headers = pd.Index([c if c != 'Line_Item' and isinstance(c, str) else None for c in columns], dtype=object)
+        # One bulk parse, then month -> quarter arithmetic on the whole array
+        months = pd.to_datetime(headers, format='ISO8601', errors='coerce').month.to_numpy(dtype=float)
+        quarters = (np.nan_to_num(months, nan=1).astype(int) - 1) // 3 + 1
+        return np.where(np.isnan(months), '', np.char.add('Q', quarters.astype(str))).tolist()
 
-    def format_excel_sheet(self, writer, sheet_name, df):
-        """Apply professional formatting to Excel sheet with quarter labels"""
-        ws = writer.sheets[sheet_name]
+    def _write_dataframe(self, writer, sheet_name, df, quarters=None):
+        """Write a DataFrame to a new formatted sheet one row at a time.
+
+        Rows go through ``worksheet.write_row`` instead of pandas' per-cell
+        ExcelFormatter. format_excel_sheet writes the quarter labels (row 1) and
+        the header (row 2) first and the data follows from row 3, so rows are
+        emitted strictly top to bottom as xlsxwriter's constant_memory mode requires.
+        """
+        ws = writer.book.add_worksheet(sheet_name)
+        self.format_excel_sheet(writer, sheet_name, df, quarters)
+        
+        # Datetime columns go out as serial day numbers computed in one vectorized
+        # step instead of per cell; format_excel_sheet gave those columns the date
+        # format, so they still display (and read back) as dates
+        date_cols = [col for col in df.columns if pd.api.types.is_datetime64_dtype(df[col])]
+        if date_cols:
+            df = df.assign(**{col: (df[col] - EXCEL_EPOCH) / pd.Timedelta(days=1) for col in date_cols})
+        
+        # NaN/NaT become empty cells; xlsxwriter rejects NaN numbers. Cells are
+        # boxed as Python objects one WRITE_CHUNK_ROWS slice at a time, so a large
+        # raw sheet never holds the whole frame as objects at once; each slice is
+        # a single object ndarray whose tolist() yields the row lists directly
+        for start in range(0, len(df), WRITE_CHUNK_ROWS):
+            chunk = df.iloc[start:start + WRITE_CHUNK_ROWS]
+            values = chunk.to_numpy(dtype=object)
+            values[chunk.isna().to_numpy()] = None
+            for row_idx, row in enumerate(values.tolist(), start=start + 2):
+                ws.write_row(row_idx, 0, row)
+        return ws
+
+    def format_excel_sheet(self, writer, sheet_name, df, quarters=None):
+        """Apply professional formatting to Excel sheet with quarter labels.
+
+        Called by ``_write_dataframe`` on the freshly added sheet before any data
+        rows are written (in constant_memory mode earlier rows cannot be revisited).
         
-        # Insert row at top for quarter labels
-        ws.insert_rows(1)
-        
-        # Add quarter labels for each date column
-        for col_idx, col_name in enumerate(df.columns, start=1):
-            if col_name != 'Line_Item' and isinstance(col_name, str):
-                quarter = self._get_quarter_from_date(col_name)
-                cell = ws.cell(row=1, column=col_idx)
-                cell.value = quarter
-        
-        # Format quarter row (row 1)
-        quarter_format = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-        quarter_font = Font(bold=True, color='FFFFFF', size=11)
-        for cell in ws[1]:
-            cell.fill = quarter_format
-            cell.font = quarter_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Format date header row (row 2)
-        header_format = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-        header_font = Font(bold=True, color='FFFFFF', size=11)
-        for cell in ws[2]:
-            cell.fill = header_format
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Adjust column widths
-        for column in ws.columns:
-            max_len = 0
-            col_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    txt = str(cell.value) if cell.value is not None else ""
-                    if len(txt) > max_len:
-                        max_len = len(txt)
-                except Exception:
-                    pass
-            ws.column_dimensions[col_letter].width = min(max_len + 2, 50)
+        Args:
+            quarters: Precomputed quarter label per column (derived from the
+                headers when omitted)
+        """
+        workbook = writer.book
+        ws = writer.sheets[sheet_name]
         
-        # Format number cells (starting from row 3)
-        accounting_format = '#,##0'
-        for row in ws.iter_rows(min_row=3):
-            for cell in row[1:]:
-                if cell.value is not None and isinstance(cell.value, (int, float)):
-                    cell.number_format = accounting_format
-                    cell.alignment = Alignment(horizontal='right', vertical='center')
+        # Formats are created once per sheet and applied per row/column
+        quarter_format = workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'font_size': 11, 'bg_color': '#4472C4',
+            'align': 'center', 'valign': 'vcenter',
+        })
+        header_format = workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'font_size': 11, 'bg_color': '#366092',
+            'align': 'center', 'valign': 'vcenter',
+        })
+        accounting_format = workbook.add_format({
+            'num_format': '#,##0', 'align': 'right', 'valign': 'vcenter',
+        })
+        date_format = workbook.add_format({'num_format': EXCEL_DATE_FORMAT})
+        
+        # Quarter labels for each date column (row 1)
+        if quarters is None:
+            quarters = self._get_quarter_labels(df.columns)
+        ws.write_row(0, 0, quarters, quarter_format)
+        
+        # Date header row (row 2)
+        ws.write_row(1, 0, [str(c) for c in df.columns], header_format)
+        
+        # Column widths, plus accounting format on numeric columns (skip first
+        # column) and the date format on datetime columns
+        for col_idx, col_name in enumerate(df.columns):
+            values = df[col_name]
+            is_date = pd.api.types.is_datetime64_dtype(values)
+            if is_date:
+                # Every date renders as EXCEL_DATE_FORMAT, so there is nothing to measure
+                value_len = len(EXCEL_DATE_FORMAT) if values.notna().any() else 0
+            else:
+                # Longest rendered value per column in one vectorized str.len() reduction
+                value_lens = values.dropna().astype(object).astype(str).str.len()
+                value_len = int(value_lens.max()) if len(value_lens) else 0
+            max_len = max(len(str(col_name)), len(quarters[col_idx]), value_len)
+            width = min(max_len + 2, 50)
+            if col_idx > 0 and pd.api.types.is_numeric_dtype(values):
+                ws.set_column(col_idx, col_idx, width, accounting_format)
+            elif is_date:
+                ws.set_column(col_idx, col_idx, width, date_format)
+            else:
+                ws.set_column(col_idx, col_idx, width)
         
         # Freeze panes to keep headers visible
-        ws.freeze_panes = 'B3'
+        ws.freeze_panes(2, 1)
+
+    def _write_raw_data(self, df, output_filename, raw_format):
+        """
+        Write the raw facts next to the workbook instead of into it.
+        
+        Args:
+            df: Raw facts (after Q4 calculation)
+            output_filename: Workbook path; the raw file reuses its stem
+            raw_format: 'csv' (gzip-compressed) or 'parquet' (needs pyarrow or fastparquet)
+        
+        Returns:
+            Path of the file written
+        """
+        stem = os.path.splitext(output_filename)[0]
+        if raw_format == 'parquet':
+            raw_filename = f"{stem}_raw.parquet"
+            df.to_parquet(raw_filename, index=False)
+        else:
+            raw_filename = f"{stem}_raw.csv.gz"
+            df.to_csv(raw_filename, index=False, compression='gzip')
+        logger.info(f"Raw data saved: {raw_filename}")
+        return raw_filename
 
     # -------------------------------------------------------------------------
     # Main Export Function
     # -------------------------------------------------------------------------
-    def export_to_excel(self, output_filename, start_year=2020):
-        """Extract all data and export to professionally formatted Excel file"""
+    def export_to_excel(self, output_filename, start_year=2020, keep_all_facts=False, raw_format='csv'):
+        """
+        Extract all data and export to professionally formatted Excel file
+        
+        Args:
+            output_filename: Path of the .xlsx file to write
+            start_year: First filing year to include
+            keep_all_facts: Keep every numeric fact in the raw data output, not
+                only the tags used by the statement and segment sheets
+            raw_format: Where the raw facts go (see RAW_FORMATS): 'csv' writes
+                <name>_raw.csv.gz, 'parquet' writes <name>_raw.parquet, 'xlsx'
+                keeps them as the 'All Data - Raw' sheet of the workbook, and None
+                skips them (statement and segment sheets only). The path of a
+                separate raw file is kept in self.raw_data_file
+        """
+        if raw_format is not None and raw_format not in RAW_FORMATS:
+            raise ValueError(f"raw_format must be one of {RAW_FORMATS} or None, got {raw_format!r}")
+        if raw_format == 'parquet' and not HAS_PARQUET:
+            raise ImportError("raw_format='parquet' requires pyarrow or fastparquet")
+        
+        self.raw_data_file = None
+        
         logger.info("=" * 60)
         logger.info(f"Starting comprehensive extraction for {self.company_name}")
         logger.info(f"Data range: {start_year} - Present")
         logger.info("=" * 60)
         
         # Extract all data
-        df = self.extract_all_data(start_year)
+        df = self.extract_all_data(start_year, keep_all_facts=keep_all_facts)
         if df.empty:
             logger.warning("No data extracted!")
             return None
@@ -1392,55 +2010,65 @@ class ComprehensiveXBRLExtractor:
         # Calculate Q4 data
         df = self.calculate_q4_data(df)
         
+        # Segment Sheets
+        segment_configs = [
+            ('ConstructionIndustriesMember', 'Construction Industries'),
+            ('ResourceIndustriesMember', 'Resource Industries'),
+            ('EnergyandTransportationMember', 'Energy & Transportation'),
+            ('FinancialProductsSegmentMember', 'Financial Products Segment'),
+        ]
+        
+        # Pivots only read the shared frame, so they are built concurrently;
+        # the workbook itself is written serially below
+        pivot_df = df[list(PIVOT_COLUMNS)]
+        statement_sheets = [
+            ('income', 'Income Statement', 'Income Statement - Quarterly'),
+            ('balance', 'Balance Sheet', 'Balance Sheet - Quarterly'),
+            ('cashflow', 'Cash Flow Statement', 'Cash Flow - Quarterly'),
+        ]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            statement_futures = []
+            for statement_type, title, sheet_name in statement_sheets:
+                logger.info(f"Creating {title}")
+                statement_futures.append((sheet_name, executor.submit(self.create_statement_pivot, pivot_df, statement_type)))
+            segment_futures = []
+            for member_name, sheet_name in segment_configs:
+                logger.info(f"Creating {sheet_name} segment sheet")
+                segment_futures.append((sheet_name, executor.submit(self._create_segment_pivot_with_fallback, pivot_df, member_name)))
+            statement_pivots = [(sheet_name, future.result()) for sheet_name, future in statement_futures]
+            segment_pivots = [(sheet_name, future.result()) for sheet_name, future in segment_futures]
+        
+        # Nothing would go into the workbook: skip creating it, but still write
+        # the raw facts so there is something to inspect
+        if raw_format != 'xlsx' and all(pivot.empty for _, pivot in statement_pivots + segment_pivots):
+            logger.warning("No statement or segment data to export - workbook not written")
+            if raw_format is not None:
+                self.raw_data_file = self._write_raw_data(df, output_filename, raw_format)
+            return None
+        
         # Create Excel file with multiple sheets
-        with pd.ExcelWriter(output_filename, engine='openpyxl') as writer:
-            # Raw data sheet
-            df.to_excel(writer, sheet_name='All Data - Raw', index=False)
-            self.format_excel_sheet(writer, 'All Data - Raw', df)
-            
-            # Income Statement
-            logger.info("Creating Income Statement")
-            income_pivot = self.create_statement_pivot(df, 'income')
-            if not income_pivot.empty:
-                income_pivot.to_excel(writer, sheet_name='Income Statement - Quarterly', index=False)
-                self.format_excel_sheet(writer, 'Income Statement - Quarterly', income_pivot)
-            
-            # Balance Sheet
-            logger.info("Creating Balance Sheet")
-            balance_pivot = self.create_statement_pivot(df, 'balance')
-            if not balance_pivot.empty:
-                balance_pivot.to_excel(writer, sheet_name='Balance Sheet - Quarterly', index=False)
-                self.format_excel_sheet(writer, 'Balance Sheet - Quarterly', balance_pivot)
-            
-            # Cash Flow Statement
-            logger.info("Creating Cash Flow Statement")
-            cashflow_pivot = self.create_statement_pivot(df, 'cashflow')
-            if not cashflow_pivot.empty:
-                cashflow_pivot.to_excel(writer, sheet_name='Cash Flow - Quarterly', index=False)
-                self.format_excel_sheet(writer, 'Cash Flow - Quarterly', cashflow_pivot)
+        # constant_memory streams each row to disk as it is written instead of
+        # holding the whole workbook in memory until close
+        excel_options = {'default_date_format': EXCEL_DATE_FORMAT, 'constant_memory': True}
+        with pd.ExcelWriter(output_filename, engine='xlsxwriter', engine_kwargs={'options': excel_options}) as writer:
+            # Raw data sheet (only when the raw facts are kept in the workbook)
+            if raw_format == 'xlsx':
+                self._write_dataframe(writer, 'All Data - Raw', df)
             
-            # Segment Sheets
-            segment_configs = [
-                ('ConstructionIndustriesMember', 'Construction Industries'),
-                ('ResourceIndustriesMember', 'Resource Industries'),
-                ('EnergyandTransportationMember', 'Energy & Transportation'),
-                ('FinancialProductsSegmentMember', 'Financial Products Segment'),
-            ]
+            # Income Statement, Balance Sheet, Cash Flow Statement
+            for sheet_name, pivot in statement_pivots:
+                if not pivot.empty:
+                    self._write_dataframe(writer, sheet_name, pivot, pivot.attrs.get('quarters'))
             
-            for member_name, sheet_name in segment_configs:
-                logger.info(f"Creating {sheet_name} segment sheet")
-                seg_pivot = self.create_segment_pivot(df, member_name)
-                # Fallback: Financial Products may use alternate member name
-                if seg_pivot.empty and 'FinancialProducts' in member_name:
-                    alt_name = 'FinancialProductsMember' if member_name == 'FinancialProductsSegmentMember' else 'FinancialProductsSegmentMember'
-                    logger.info(f"  Trying alternate member: {alt_name}")
-                    seg_pivot = self.create_segment_pivot(df, alt_name)
+            for sheet_name, seg_pivot in segment_pivots:
                 if not seg_pivot.empty:
-                    seg_pivot.to_excel(writer, sheet_name=sheet_name, index=False)
-                    self.format_excel_sheet(writer, sheet_name, seg_pivot)
+                    self._write_dataframe(writer, sheet_name, seg_pivot, seg_pivot.attrs.get('quarters'))
                 else:
                     logger.warning(f"No data for segment: {sheet_name}")
         
+        if raw_format not in (None, 'xlsx'):
+            self.raw_data_file = self._write_raw_data(df, output_filename, raw_format)
+        
         logger.info("=" * 60)
         logger.info(f"Export complete! File saved: {output_filename}")
         logger.info("=" * 60)
@@ -1486,7 +2114,8 @@ def main():
         print("  Resource Industries - Segment")
         print("  Energy & Transportation - Segment")
         print("  Financial Products - Segment")
-        print("  All raw data with segment breakdowns")
+        if extractor.raw_data_file:
+            print(f"\nRaw data with segment breakdowns: {extractor.raw_data_file}")
         print(f"{'='*60}\n")
 
 
@@ -9,9 +9,6 @@ from datetime import datetime
 import time
 import json
 import logging
-from openpyxl import load_workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils import get_column_letter
 
 # Configure logging
 logging.basicConfig(
@@ -20,6 +17,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Date cells are written as Excel serial day numbers (days since EXCEL_EPOCH,
+# valid for dates after 1900-02-28) and displayed with EXCEL_DATE_FORMAT
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+EXCEL_DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# Low-cardinality label columns stored as pandas categoricals (int codes plus
+# a small table of unique values) instead of one Python str per row
+CATEGORICAL_COLUMNS = ('Line_Item', 'XBRL_Tag', 'Form', 'Fiscal_Period')
+
 class SECEdgarExtractor:
     """Extract financial data from SEC EDGAR API"""
     
@@ -117,6 +123,8 @@ class SECEdgarExtractor:
         df['End_Date'] = pd.to_datetime(df['End_Date'])
         df['Filed_Date'] = pd.to_datetime(df['Filed_Date'])
         df['Start_Date'] = pd.to_datetime(df['Start_Date'])
+        for col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype('category')
         
         # Sort by end date and line item
         df = df.sort_values(['End_Date', 'Line_Item'], ascending=[False, True])
@@ -330,13 +338,12 @@ class SECEdgarExtractor:
                 logger.warning(f"No 3-month period data found for {statement_type}")
                 return pd.DataFrame()
         
-        # Create pivot table
-        pivot = annual_df.pivot_table(
-            index='Line_Item',
-            columns='End_Date',
-            values='Value',
-            aggfunc='first'
-        )
+        # Keep the first reported value per (line item, period) and unstack;
+        # same result as pivot_table(aggfunc='first') without its groupby overhead
+        pivot = (annual_df.dropna(subset=['Line_Item', 'End_Date', 'Value'])
+                 .drop_duplicates(subset=['Line_Item', 'End_Date'])
+                 .set_index(['Line_Item', 'End_Date'])['Value']
+                 .unstack('End_Date'))
         
         # Sort columns by date (most recent first)
         pivot = pivot[sorted(pivot.columns, reverse=True)]
@@ -353,53 +360,96 @@ class SECEdgarExtractor:
         
         return pivot
     
-    def format_excel_sheet(self, writer, sheet_name, df):
+    def _write_dataframe(self, writer, sheet_name, df, index=False):
+        """
+        Write a DataFrame to a new formatted sheet one row at a time
+        
+        format_excel_sheet runs first and the rows follow strictly top to
+        bottom, as xlsxwriter's constant_memory mode requires (rows already
+        flushed to disk cannot be revisited).
+        
+        Args:
+            writer: ExcelWriter object (xlsxwriter engine)
+            sheet_name: Name of the sheet
+            df: DataFrame to write
+            index: Write the DataFrame index as the first column
+        """
+        worksheet = writer.book.add_worksheet(sheet_name)
+        self.format_excel_sheet(writer, sheet_name, df, index)
+        
+        if index:
+            df = df.reset_index()
+        # Datetime columns go out as serial day numbers computed in one vectorized
+        # step; format_excel_sheet gave those columns the date format
+        date_cols = [col for col in df.columns if pd.api.types.is_datetime64_dtype(df[col])]
+        if date_cols:
+            df = df.assign(**{col: (df[col] - EXCEL_EPOCH) / pd.Timedelta(days=1) for col in date_cols})
+        # NaN/NaT become empty cells; xlsxwriter rejects NaN numbers. One object
+        # ndarray for the whole sheet; tolist() yields the row lists directly
+        values = df.to_numpy(dtype=object)
+        values[df.isna().to_numpy()] = None
+        for row_idx, row in enumerate(values.tolist(), start=1):
+            worksheet.write_row(row_idx, 0, row)
+        return worksheet
+    
+    def format_excel_sheet(self, writer, sheet_name, df, index=False):
         """
         Apply formatting to Excel sheet
         
         Args:
-            writer: ExcelWriter object
+            writer: ExcelWriter object (xlsxwriter engine)
             sheet_name: Name of the sheet
-            df: DataFrame that was written
+            df: DataFrame being written
+            index: Whether the DataFrame index is written as the first column
+        
+        Called by _write_dataframe on the fresh sheet before any data rows.
         """
         workbook = writer.book
         worksheet = writer.sheets[sheet_name]
         
         # Header formatting
-        header_format = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-        header_font = Font(bold=True, color='FFFFFF', size=11)
-        
-        # Apply header formatting to the actual first row in the worksheet
-        for cell in next(worksheet.iter_rows(min_row=1, max_row=1)):
-            cell.fill = header_format
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        # Adjust column widths
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    # measure string length of the cell value safely
-                    text = str(cell.value) if cell.value is not None else ""
-                    if len(text) > max_length:
-                        max_length = len(text)
-                except:
-                    pass
+        header_format = workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'font_size': 11, 'bg_color': '#366092',
+            'align': 'center', 'valign': 'vcenter',
+        })
+        accounting_format = workbook.add_format({
+            'num_format': '#,##0', 'align': 'right', 'valign': 'vcenter',
+        })
+        date_format = workbook.add_format({'num_format': EXCEL_DATE_FORMAT})
+        
+        # xlsxwriter cannot read cells back, so work from the DataFrame itself
+        headers = [str(c) for c in df.columns]
+        columns = [df.iloc[:, i] for i in range(df.shape[1])]
+        if index:
+            headers.insert(0, df.index.name or '')
+            columns.insert(0, df.index.to_series())
+        
+        # Apply header formatting to the first row
+        worksheet.write_row(0, 0, headers, header_format)
+        
+        # Adjust column widths; accounting number format on numeric columns
+        # (exclude first column which holds line items/index), date format on
+        # datetime columns
+        for col_idx, (header, values) in enumerate(zip(headers, columns)):
+            is_date = pd.api.types.is_datetime64_dtype(values)
+            if is_date:
+                # Every date renders as EXCEL_DATE_FORMAT, so there is nothing to measure
+                value_len = len(EXCEL_DATE_FORMAT) if values.notna().any() else 0
+            else:
+                # Longest rendered value per column in one vectorized str.len() reduction
+                value_lens = values.dropna().astype(object).astype(str).str.len()
+                value_len = int(value_lens.max()) if len(value_lens) else 0
+            max_length = max(len(header), value_len)
             adjusted_width = min(max_length + 2, 50)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        # Apply accounting number format to numeric cells (exclude first column which holds line items/index)
-        accounting_format = '#,##0'
-        for row in worksheet.iter_rows(min_row=2):  # skip header row
-            for cell in row[1:]:  # skip first column (A)
-                if cell.value is not None and isinstance(cell.value, (int, float)):
-                    cell.number_format = accounting_format
-                    cell.alignment = Alignment(horizontal='right', vertical='center')
+            if col_idx > 0 and pd.api.types.is_numeric_dtype(values):
+                worksheet.set_column(col_idx, col_idx, adjusted_width, accounting_format)
+            elif is_date:
+                worksheet.set_column(col_idx, col_idx, adjusted_width, date_format)
+            else:
+                worksheet.set_column(col_idx, col_idx, adjusted_width)
         
         # Freeze first column (A) and header row simultaneously
-        worksheet.freeze_panes = 'B2'
+        worksheet.freeze_panes(1, 1)
     
     def export_to_excel(self, output_filename='caterpillar_financials.xlsx'):
         """
@@ -416,7 +466,10 @@ class SECEdgarExtractor:
         facts_data = self.get_company_facts()
         
         # Create Excel writer
-        with pd.ExcelWriter(output_filename, engine='openpyxl') as writer:
+        # constant_memory flushes each row as it is written instead of holding
+        # every cell until close; _write_dataframe writes rows in order for it
+        excel_options = {'default_date_format': EXCEL_DATE_FORMAT, 'constant_memory': True}
+        with pd.ExcelWriter(output_filename, engine='xlsxwriter', engine_kwargs={'options': excel_options}) as writer:
             
             # 1. Income Statement
             logger.info("\n" + "="*60)
@@ -425,14 +478,12 @@ class SECEdgarExtractor:
             income_df = self.extract_financial_statement_data(facts_data, 'income')
             if not income_df.empty:
                 # Raw data
-                income_df.to_excel(writer, sheet_name='Income Statement - Raw', index=False)
-                self.format_excel_sheet(writer, 'Income Statement - Raw', income_df)
+                self._write_dataframe(writer, 'Income Statement - Raw', income_df)
                 
                 # Pivot view
                 income_pivot = self.create_pivot_table(income_df, 'income')
                 if not income_pivot.empty:
-                    income_pivot.to_excel(writer, sheet_name='Income Statement - Quarterly')
-                    self.format_excel_sheet(writer, 'Income Statement - Quarterly', income_pivot)
+                    self._write_dataframe(writer, 'Income Statement - Quarterly', income_pivot, index=True)
             
             # 2. Balance Sheet
             logger.info("\n" + "="*60)
@@ -441,14 +492,12 @@ class SECEdgarExtractor:
             balance_df = self.extract_financial_statement_data(facts_data, 'balance')
             if not balance_df.empty:
                 # Raw data
-                balance_df.to_excel(writer, sheet_name='Balance Sheet - Raw', index=False)
-                self.format_excel_sheet(writer, 'Balance Sheet - Raw', balance_df)
+                self._write_dataframe(writer, 'Balance Sheet - Raw', balance_df)
                 
                 # Pivot view
                 balance_pivot = self.create_pivot_table(balance_df, 'balance')
                 if not balance_pivot.empty:
-                    balance_pivot.to_excel(writer, sheet_name='Balance Sheet - Quarterly')
-                    self.format_excel_sheet(writer, 'Balance Sheet - Quarterly', balance_pivot)
+                    self._write_dataframe(writer, 'Balance Sheet - Quarterly', balance_pivot, index=True)
             
             # 3. Cash Flow Statement
             logger.info("\n" + "="*60)
@@ -457,14 +506,12 @@ class SECEdgarExtractor:
             cashflow_df = self.extract_financial_statement_data(facts_data, 'cashflow')
             if not cashflow_df.empty:
                 # Raw data
-                cashflow_df.to_excel(writer, sheet_name='Cash Flow - Raw', index=False)
-                self.format_excel_sheet(writer, 'Cash Flow - Raw', cashflow_df)
+                self._write_dataframe(writer, 'Cash Flow - Raw', cashflow_df)
                 
                 # Pivot view
                 cashflow_pivot = self.create_pivot_table(cashflow_df, 'cashflow')
                 if not cashflow_pivot.empty:
-                    cashflow_pivot.to_excel(writer, sheet_name='Cash Flow - Quarterly')
-                    self.format_excel_sheet(writer, 'Cash Flow - Quarterly', cashflow_pivot)
+                    self._write_dataframe(writer, 'Cash Flow - Quarterly', cashflow_pivot, index=True)
         
         logger.info("\n" + "="*60)
         logger.info(f"✓ Export complete! File saved: {output_filename}")
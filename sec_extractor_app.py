@@ -9,15 +9,21 @@ import requests
 import time
 import logging
 from datetime import datetime
-from openpyxl import load_workbook
-from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils import get_column_letter
 import io
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Date cells are written as Excel serial day numbers (days since EXCEL_EPOCH,
+# valid for dates after 1900-02-28) and displayed with EXCEL_DATE_FORMAT
+EXCEL_EPOCH = pd.Timestamp('1899-12-30')
+EXCEL_DATE_FORMAT = 'yyyy-mm-dd hh:mm:ss'
+
+# Low-cardinality label columns stored as pandas categoricals (int codes plus
+# a small table of unique values) instead of one Python str per row
+CATEGORICAL_COLUMNS = ('Line_Item', 'XBRL_Tag', 'Form', 'Fiscal_Period')
+
 # Page configuration
 st.set_page_config(
     page_title="SEC Financial Data Extractor",
@@ -154,6 +160,8 @@ class SECEdgarExtractor:
         df['End_Date'] = pd.to_datetime(df['End_Date'])
         df['Filed_Date'] = pd.to_datetime(df['Filed_Date'])
         df['Start_Date'] = pd.to_datetime(df['Start_Date'])
+        for col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype('category')
         df = df.sort_values(['End_Date', 'Line_Item'], ascending=[False, True])
         
         return df
@@ -256,12 +264,10 @@ class SECEdgarExtractor:
             if annual_df.empty:
                 return pd.DataFrame()
         
-        pivot = annual_df.pivot_table(
-            index='Line_Item',
-            columns='End_Date',
-            values='Value',
-            aggfunc='first'
-        )
+        pivot = (annual_df.dropna(subset=['Line_Item', 'End_Date', 'Value'])
+                 .drop_duplicates(subset=['Line_Item', 'End_Date'])
+                 .set_index(['Line_Item', 'End_Date'])['Value']
+                 .unstack('End_Date'))
         
         pivot = pivot[sorted(pivot.columns, reverse=True)]
         pivot.columns = [col.strftime('%Y-%m-%d') if isinstance(col, datetime) else str(col)
@@ -274,40 +280,64 @@ class SECEdgarExtractor:
         
         return pivot
     
-    def format_excel_sheet(self, writer, sheet_name, df):
-        """Apply formatting to Excel sheet"""
+    def _write_dataframe(self, writer, sheet_name, df, index=False):
+        """Write a DataFrame to a new formatted sheet row by row (constant_memory safe)"""
+        worksheet = writer.book.add_worksheet(sheet_name)
+        self.format_excel_sheet(writer, sheet_name, df, index)
+        
+        if index:
+            df = df.reset_index()
+        # Datetime columns go out as serial day numbers computed in one vectorized
+        # step; format_excel_sheet gave those columns the date format
+        date_cols = [col for col in df.columns if pd.api.types.is_datetime64_dtype(df[col])]
+        if date_cols:
+            df = df.assign(**{col: (df[col] - EXCEL_EPOCH) / pd.Timedelta(days=1) for col in date_cols})
+        values = df.to_numpy(dtype=object)
+        values[df.isna().to_numpy()] = None
+        for row_idx, row in enumerate(values.tolist(), start=1):
+            worksheet.write_row(row_idx, 0, row)
+        return worksheet
+    
+    def format_excel_sheet(self, writer, sheet_name, df, index=False):
+        """Apply formatting to Excel sheet (xlsxwriter engine)"""
         workbook = writer.book
         worksheet = writer.sheets[sheet_name]
         
-        header_format = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
-        header_font = Font(bold=True, color='FFFFFF', size=11)
-        
-        for cell in next(worksheet.iter_rows(min_row=1, max_row=1)):
-            cell.fill = header_format
-            cell.font = header_font
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-        
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    text = str(cell.value) if cell.value is not None else ""
-                    if len(text) > max_length:
-                        max_length = len(text)
-                except:
-                    pass
+        header_format = workbook.add_format({
+            'bold': True, 'font_color': '#FFFFFF', 'font_size': 11, 'bg_color': '#366092',
+            'align': 'center', 'valign': 'vcenter',
+        })
+        accounting_format = workbook.add_format({
+            'num_format': '#,##0', 'align': 'right', 'valign': 'vcenter',
+        })
+        date_format = workbook.add_format({'num_format': EXCEL_DATE_FORMAT})
+        
+        # xlsxwriter cannot read cells back, so work from the DataFrame itself
+        headers = [str(c) for c in df.columns]
+        columns = [df.iloc[:, i] for i in range(df.shape[1])]
+        if index:
+            headers.insert(0, df.index.name or '')
+            columns.insert(0, df.index.to_series())
+        
+        worksheet.write_row(0, 0, headers, header_format)
+        
+        for col_idx, (header, values) in enumerate(zip(headers, columns)):
+            is_date = pd.api.types.is_datetime64_dtype(values)
+            if is_date:
+                value_len = len(EXCEL_DATE_FORMAT) if values.notna().any() else 0
+            else:
+                value_lens = values.dropna().astype(object).astype(str).str.len()
+                value_len = int(value_lens.max()) if len(value_lens) else 0
+            max_length = max(len(header), value_len)
             adjusted_width = min(max_length + 2, 50)
-            worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        accounting_format = '#,##0'
-        for row in worksheet.iter_rows(min_row=2):
-            for cell in row[1:]:
-                if cell.value is not None and isinstance(cell.value, (int, float)):
-                    cell.number_format = accounting_format
-                    cell.alignment = Alignment(horizontal='right', vertical='center')
-        
-        worksheet.freeze_panes = 'B2'
+            if col_idx > 0 and pd.api.types.is_numeric_dtype(values):
+                worksheet.set_column(col_idx, col_idx, adjusted_width, accounting_format)
+            elif is_date:
+                worksheet.set_column(col_idx, col_idx, adjusted_width, date_format)
+            else:
+                worksheet.set_column(col_idx, col_idx, adjusted_width)
+        
+        worksheet.freeze_panes(1, 1)
     
     def export_to_excel(self, output_filename, progress_callback=None):
         """Main function to extract all data and export to Excel"""
@@ -319,46 +349,43 @@ class SECEdgarExtractor:
         
         output = io.BytesIO()
         
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        # constant_memory flushes each row as it is written instead of holding
+        # every cell until close; _write_dataframe writes rows in order for it
+        excel_options = {'default_date_format': EXCEL_DATE_FORMAT, 'constant_memory': True}
+        with pd.ExcelWriter(output, engine='xlsxwriter', engine_kwargs={'options': excel_options}) as writer:
             
             if progress_callback:
                 progress_callback(0.3, "Processing Income Statement...")
             
             income_df = self.extract_financial_statement_data(facts_data, 'income')
             if not income_df.empty:
-                income_df.to_excel(writer, sheet_name='Income Statement - Raw', index=False)
-                self.format_excel_sheet(writer, 'Income Statement - Raw', income_df)
+                self._write_dataframe(writer, 'Income Statement - Raw', income_df)
                 
                 income_pivot = self.create_pivot_table(income_df, 'income')
                 if not income_pivot.empty:
-                    income_pivot.to_excel(writer, sheet_name='Income Statement - Quarterly')
-                    self.format_excel_sheet(writer, 'Income Statement - Quarterly', income_pivot)
+                    self._write_dataframe(writer, 'Income Statement - Quarterly', income_pivot, index=True)
             
             if progress_callback:
                 progress_callback(0.5, "Processing Balance Sheet...")
             
             balance_df = self.extract_financial_statement_data(facts_data, 'balance')
             if not balance_df.empty:
-                balance_df.to_excel(writer, sheet_name='Balance Sheet - Raw', index=False)
-                self.format_excel_sheet(writer, 'Balance Sheet - Raw', balance_df)
+                self._write_dataframe(writer, 'Balance Sheet - Raw', balance_df)
                 
                 balance_pivot = self.create_pivot_table(balance_df, 'balance')
                 if not balance_pivot.empty:
-                    balance_pivot.to_excel(writer, sheet_name='Balance Sheet - Quarterly')
-                    self.format_excel_sheet(writer, 'Balance Sheet - Quarterly', balance_pivot)
+                    self._write_dataframe(writer, 'Balance Sheet - Quarterly', balance_pivot, index=True)
             
             if progress_callback:
                 progress_callback(0.8, "Processing Cash Flow Statement...")
             
             cashflow_df = self.extract_financial_statement_data(facts_data, 'cashflow')
             if not cashflow_df.empty:
-                cashflow_df.to_excel(writer, sheet_name='Cash Flow - Raw', index=False)
-                self.format_excel_sheet(writer, 'Cash Flow - Raw', cashflow_df)
+                self._write_dataframe(writer, 'Cash Flow - Raw', cashflow_df)
                 
                 cashflow_pivot = self.create_pivot_table(cashflow_df, 'cashflow')
                 if not cashflow_pivot.empty:
-                    cashflow_pivot.to_excel(writer, sheet_name='Cash Flow - Quarterly')
-                    self.format_excel_sheet(writer, 'Cash Flow - Quarterly', cashflow_pivot)
+                    self._write_dataframe(writer, 'Cash Flow - Quarterly', cashflow_pivot, index=True)
         
         if progress_callback:
             progress_callback(1.0, "Complete!")